@@ -0,0 +1,262 @@
+from __future__ import annotations
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .roles import load_roles_file, role_specs
+
+try:  # optional: pip install "discord-guardian[analytics]"
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+
+@dataclass
+class HeartsSample:
+    """Sorted hearts of one guild, as int64 (a numpy array, or array('q') without numpy)."""
+
+    guild_id: str
+    values: Any
+    scanned_at: float
+    scan_seconds: float
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def count_below(self, edges: Sequence[int]) -> List[int]:
+        """Number of members with hearts < each edge, for ascending edges."""
+        if np is not None and isinstance(self.values, np.ndarray):
+            return np.searchsorted(self.values, np.asarray(edges, dtype=np.int64), side="left").tolist()
+        return [bisect_left(self.values, e) for e in edges]
+
+    def mean(self) -> float:
+        if not len(self.values):
+            return 0.0
+        if np is not None and isinstance(self.values, np.ndarray):
+            return float(self.values.mean())
+        return sum(self.values) / len(self.values)
+
+    def percentile(self, q: float) -> float:
+        # Linear interpolation between closest ranks, numpy's default method
+        n = len(self.values)
+        if not n:
+            return 0.0
+        pos = (n - 1) * q / 100.0
+        lo = int(math.floor(pos))
+        hi = min(lo + 1, n - 1)
+        return float(self.values[lo] + (self.values[hi] - self.values[lo]) * (pos - lo))
+
+
+def scan_hearts(store, guild_id: str, page_size: int = 1000) -> HeartsSample:
+    """Read every member's hearts in one paged scan into a compact sorted array."""
+    started = time.perf_counter()
+    buf = array("q")
+    for page in store.iter_guild_hearts(guild_id, page_size=page_size):
+        buf.extend(hearts for _, hearts in page)
+    if np is not None:
+        values = np.sort(np.frombuffer(buf, dtype=np.int64))
+    else:
+        values = array("q", sorted(buf))
+    return HeartsSample(guild_id, values, time.time(), time.perf_counter() - started)
+
+
+def _ladder(roles: List[Dict]) -> List[Tuple[int, str]]:
+    # (minHearts, name) ascending; on equal thresholds role_for_hearts picks the one listed first
+    ladder: Dict[int, str] = {}
+    for spec in roles:
+        ladder.setdefault(int(spec.get("minHearts", 0)), spec.get("name"))
+    return sorted(ladder.items())
+
+
+def _segments(sample: HeartsSample, edges: Sequence[int]) -> List[int]:
+    # Member counts in (-inf, e0), [e0, e1), ..., [e_last, +inf)
+    below = sample.count_below(edges)
+    bounds = [0] + below + [len(sample)]
+    return [bounds[i + 1] - bounds[i] for i in range(len(bounds) - 1)]
+
+
+def role_counts(sample: HeartsSample, roles: List[Dict]) -> Dict[str, int]:
+    """Members per level role, using the same rule as role_for_hearts."""
+    ladder = _ladder(roles)
+    counts = _segments(sample, [t for t, _ in ladder[1:]])
+    # Anything below the lowest threshold falls back to the lowest role; listed highest first
+    return {name: counts[i] for i, (_, name) in reversed(list(enumerate(ladder)))}
+
+
+def histogram(sample: HeartsSample, bins: int = 10) -> List[Dict[str, int]]:
+    """Equal-width integer buckets from the lowest to the highest balance."""
+    n = len(sample)
+    if not n or bins <= 0:
+        return []
+    lo, hi = int(sample.values[0]), int(sample.values[-1])
+    width = max(1, math.ceil((hi - lo + 1) / bins))
+    edges = list(range(lo, hi + 1, width))[1:]
+    counts = _segments(sample, edges)
+    starts = [lo] + edges
+    return [{"from": s, "to": (starts[i + 1] - 1 if i + 1 < len(starts) else hi), "count": c} for i, (s, c) in enumerate(zip(starts, counts))]
+
+
+def simulate_roles(sample: HeartsSample, current: List[Dict], proposed: List[Dict]) -> Dict[str, Any]:
+    """Count members whose level role would change if the proposed ladder replaced the current one.
+
+    Between consecutive thresholds of either ladder both roles are constant,
+    so one searchsorted over the merged thresholds yields every transition.
+    """
+    cur, new = _ladder(current), _ladder(proposed)
+    edges = sorted({t for t, _ in cur[1:]} | {t for t, _ in new[1:]})
+    counts = _segments(sample, edges)
+    starts = [None] + edges
+
+    def pick(ladder, start):
+        if start is None:
+            return ladder[0]
+        return ladder[max(0, bisect_left([t for t, _ in ladder], start + 1) - 1)]
+
+    moves: Dict[Tuple[str, str], int] = {}
+    promoted = demoted = renamed = 0
+    for start, count in zip(starts, counts):
+        if not count:
+            continue
+        (cur_min, cur_name), (new_min, new_name) = pick(cur, start), pick(new, start)
+        if cur_name == new_name:
+            continue
+        moves[(cur_name, new_name)] = moves.get((cur_name, new_name), 0) + count
+        if new_min > cur_min:
+            promoted += count
+        elif new_min < cur_min:
+            demoted += count
+        else:
+            renamed += count
+    return {
+        "promoted": promoted,
+        "demoted": demoted,
+        "renamed": renamed,
+        "unchanged": len(sample) - promoted - demoted - renamed,
+        "moves": [{"from": a, "to": b, "count": c} for (a, b), c in sorted(moves.items(), key=lambda kv: -kv[1])],
+        "role_counts": role_counts(sample, proposed),
+    }
+
+
+def summarize(
+    sample: HeartsSample,
+    near_kick: int,
+    bins: int = 10,
+    proposed: Optional[List[Dict]] = None,
+) -> Dict[str, Any]:
+    """Build the analytics report for one guild.
+
+    Members at 0 hearts or below are kicked when they next chat; near_kick
+    counts those still above 0 but within near_kick hearts of it.
+    """
+    current = role_specs()
+    at_or_below_zero, within = sample.count_below([1, near_kick + 1])
+    report: Dict[str, Any] = {
+        "guild_id": sample.guild_id,
+        "members": len(sample),
+        "scanned_at": sample.scanned_at,
+        "scan_seconds": round(sample.scan_seconds, 3),
+        "backend": "numpy" if np is not None else "python",
+        "min": int(sample.values[0]) if len(sample) else 0,
+        "max": int(sample.values[-1]) if len(sample) else 0,
+        "mean": round(sample.mean(), 2),
+        "percentiles": {f"p{q}": round(sample.percentile(q), 1) for q in PERCENTILES},
+        "kickable": at_or_below_zero,
+        "near_kick": within - at_or_below_zero,
+        "near_kick_threshold": near_kick,
+        "histogram": histogram(sample, bins),
+        "role_counts": role_counts(sample, current),
+    }
+    if proposed is not None:
+        report["what_if"] = simulate_roles(sample, current, proposed)
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"**{report['members']}** member(s) with hearts — min {report['min']}, max {report['max']}, mean {report['mean']}",
+        "Percentiles: " + ", ".join(f"{k} {v:g}" for k, v in report["percentiles"].items()),
+        f"At or below 0❤️ (kicked on next message): {report['kickable']}",
+        f"Within {report['near_kick_threshold']}❤️ of a kick: {report['near_kick']}",
+        "Roles: " + ", ".join(f"{name} {count}" for name, count in report["role_counts"].items()),
+        "Histogram:",
+    ]
+    peak = max((b["count"] for b in report["histogram"]), default=0)
+    for b in report["histogram"]:
+        bar = "█" * (round(20 * b["count"] / peak) if peak else 0)
+        lines.append(f"`{b['from']:>6}..{b['to']:<6}` {bar} {b['count']}")
+    what_if = report.get("what_if")
+    if what_if is not None:
+        lines.append(
+            f"What-if: {what_if['promoted']} promoted, {what_if['demoted']} demoted, "
+            f"{what_if['renamed']} renamed, {what_if['unchanged']} unchanged"
+        )
+        for move in what_if["moves"][:10]:
+            lines.append(f"  {move['from']} → {move['to']}: {move['count']}")
+        lines.append("  New roles: " + ", ".join(f"{name} {count}" for name, count in what_if["role_counts"].items()))
+    return "\n".join(lines)
+
+
+class AnalyticsCache:
+    """Hearts samples per guild, reused for ttl_seconds so repeated reports skip the Firestore scan."""
+
+    def __init__(self, store, ttl_seconds: float = 300.0, page_size: int = 1000):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.page_size = page_size
+        self._samples: Dict[str, Tuple[float, HeartsSample]] = {}
+        self._lock = threading.Lock()
+
+    def sample(self, guild_id: str, refresh: bool = False) -> HeartsSample:
+        with self._lock:
+            item = self._samples.get(guild_id)
+        if item is not None and not refresh and time.monotonic() - item[0] <= self.ttl_seconds:
+            return item[1]
+        sample = scan_hearts(self.store, guild_id, page_size=self.page_size)
+        with self._lock:
+            self._samples[guild_id] = (time.monotonic(), sample)
+        return sample
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="discord-guardian-analytics", description="Hearts analytics for one guild")
+    parser.add_argument("--guild", required=True, help="guild (server) id")
+    parser.add_argument("--roles", help="proposed roles.json to simulate promotions and demotions against")
+    parser.add_argument("--bins", type=int, default=10, help="histogram buckets (default: 10)")
+    parser.add_argument("--near-kick", type=int, default=None, help="hearts above 0 that count as near a kick (default: HEART_PENALTY_FLAG)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from .firestore_store import Store
+
+    # Only Firestore access is needed offline: no Discord token or Gemini key
+    load_dotenv()
+    try:
+        proposed = load_roles_file(args.roles) if args.roles else None
+    except (OSError, ValueError) as e:
+        parser.error(f"could not read --roles: {e}")
+    if args.near_kick is None:
+        args.near_kick = int(os.getenv("HEART_PENALTY_FLAG", "10"))
+    collection = os.getenv("FIRESTORE_COLLECTION", "discord-guardian")
+    sample = scan_hearts(Store(collection), str(args.guild))
+    report = summarize(sample, args.near_kick, bins=args.bins, proposed=proposed)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(format_report(report).replace("**", "").replace("`", ""))
+
+
+if __name__ == "__main__":
+    main()
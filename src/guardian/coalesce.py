@@ -0,0 +1,73 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[int, int, int]  # (guild_id, channel_id, author_id)
+
+
+@dataclass
+class _Buffer:
+    messages: List[discord.Message] = field(default_factory=list)
+    chars: int = 0
+    first_seen: float = field(default_factory=time.monotonic)
+    timer: Optional[asyncio.Task] = None
+
+
+class FragmentCoalescer:
+    """Merge a burst of short messages from one author in one channel into one unit.
+
+    Each fragment restarts a window-second timer; the unit is flushed when
+    the author pauses, or early once it reaches max_fragments, max_chars or
+    has been open for max_wait seconds.
+    """
+
+    def __init__(
+        self,
+        on_flush: Callable[[List[discord.Message]], Awaitable[None]],
+        window: float = 2.0,
+        max_wait: float = 8.0,
+        max_fragments: int = 10,
+        max_chars: int = 1500,
+    ):
+        self.on_flush = on_flush
+        self.window = window
+        self.max_wait = max_wait
+        self.max_fragments = max(1, max_fragments)
+        self.max_chars = max_chars
+        self._buffers: Dict[_Key, _Buffer] = {}
+
+    def add(self, message: discord.Message) -> None:
+        key = (message.guild.id, message.channel.id, message.author.id)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = self._buffers[key] = _Buffer()
+        elif buf.timer is not None:
+            buf.timer.cancel()
+        buf.messages.append(message)
+        buf.chars += len(message.content or "")
+        full = (
+            len(buf.messages) >= self.max_fragments
+            or buf.chars >= self.max_chars
+            or time.monotonic() - buf.first_seen >= self.max_wait
+        )
+        delay = 0.0 if full else self.window
+        buf.timer = asyncio.get_running_loop().create_task(self._flush_later(key, buf, delay))
+
+    async def _flush_later(self, key: _Key, buf: _Buffer, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        if self._buffers.get(key) is buf:
+            del self._buffers[key]
+        try:
+            await self.on_flush(buf.messages)
+        except Exception:
+            logger.exception("Failed to handle coalesced messages")
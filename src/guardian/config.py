@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional
 import json
 import os
 from dotenv import load_dotenv
@@ -17,32 +17,103 @@ class Config:
     heart_advice: int = int(os.getenv("HEART_ADVICE", "5"))
     heart_problem_solved: int = int(os.getenv("HEART_PROBLEM_SOLVED", "10"))
     log_level: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    profile_startup: bool = os.getenv("PROFILE_STARTUP", "0").strip().lower() in ("1", "true", "yes")
     allowed_guild_id: str | None = os.getenv("ALLOWED_GUILD_ID")
     admin_role_ids: List[str] = None  # populated below
     # Special users: list of dicts with keys id (str), optional hearts (int), optional roles (list[str])
-    special_users: List[dict] = None  # populated below
+    special_users: List[dict] = None  # populated by load_special_users()
+    special_users_file: str = os.getenv("SPECIAL_USERS_FILE", "specialuser.json").strip()
+    # Gemini routing: pool of API keys and model endpoints (entries may carry a ":weight" suffix)
+    gemini_api_keys: List[str] = None  # populated below
+    gemini_models: List[str] = None  # populated below
+    gemini_escalation_models: List[str] = None  # populated below
+    gemini_key_rpm: int = int(os.getenv("GEMINI_KEY_RPM", "0"))  # 0 = no per-key quota tracking
+    gemini_eject_after: int = int(os.getenv("GEMINI_EJECT_AFTER", "3"))
+    gemini_eject_seconds: int = int(os.getenv("GEMINI_EJECT_SECONDS", "60"))
+    gemini_streaming: bool = os.getenv("GEMINI_STREAMING", "0").strip().lower() in ("1", "true", "yes")
+    gemini_max_input_chars: int = int(os.getenv("GEMINI_MAX_INPUT_CHARS", "1500"))  # longer messages keep head and tail
+    gemini_output_tokens: Dict[str, int] = None  # populated below; per-model maxOutputTokens overrides
+    # Verdict cache: reuse Gemini results for identical (normalized) content
+    verdict_cache_size: int = int(os.getenv("VERDICT_CACHE_SIZE", "5000"))
+    verdict_cache_ttl: int = int(os.getenv("VERDICT_CACHE_TTL", "3600"))
+    # Edit moderation: re-analyze only meaningful edits, debounced per message
+    edit_min_changed_chars: int = int(os.getenv("EDIT_MIN_CHANGED_CHARS", "3"))
+    edit_debounce_seconds: float = float(os.getenv("EDIT_DEBOUNCE_SECONDS", "3"))
+    # Low-memory mode for very large guilds: no member cache, on-demand member fetches
+    low_memory_mode: bool = os.getenv("LOW_MEMORY_MODE", "0").strip().lower() in ("1", "true", "yes")
+    member_lru_size: int = int(os.getenv("MEMBER_LRU_SIZE", "2000"))
+    low_memory_max_messages: int = int(os.getenv("LOW_MEMORY_MAX_MESSAGES", "200"))
+    memory_report_interval: int = int(os.getenv("MEMORY_REPORT_INTERVAL", "0"))  # seconds, 0 = only on ready
+    # Periodic level-role reconciliation against stored hearts (seconds between sweeps, 0 = off)
+    role_sweep_interval: int = int(os.getenv("ROLE_SWEEP_INTERVAL", "21600"))
+    role_sweep_page_size: int = int(os.getenv("ROLE_SWEEP_PAGE_SIZE", "500"))
+    role_sweep_workers: int = int(os.getenv("ROLE_SWEEP_WORKERS", "4"))
+    role_sweep_ops_per_second: float = float(os.getenv("ROLE_SWEEP_OPS_PER_SECOND", "2"))
+    # Flood throttling, applied in memory before any Firestore/Gemini call (0 disables a limit)
+    flood_user_max: int = int(os.getenv("FLOOD_USER_MAX", "10"))  # well above typing speed; bursts are coalesced
+    flood_user_window: float = float(os.getenv("FLOOD_USER_WINDOW", "5"))
+    flood_channel_max: int = int(os.getenv("FLOOD_CHANNEL_MAX", "30"))
+    flood_channel_window: float = float(os.getenv("FLOOD_CHANNEL_WINDOW", "5"))
+    flood_duplicate_window: float = float(os.getenv("FLOOD_DUPLICATE_WINDOW", "30"))
+    flood_penalty: int = int(os.getenv("FLOOD_PENALTY", os.getenv("HEART_PENALTY_FLAG", "10")))
+    flood_penalty_after: int = int(os.getenv("FLOOD_PENALTY_AFTER", "5"))  # dropped messages before the flood penalty
+    flood_timeout_after: int = int(os.getenv("FLOOD_TIMEOUT_AFTER", "10"))  # dropped messages before a timeout
+    flood_timeout_seconds: int = int(os.getenv("FLOOD_TIMEOUT_SECONDS", "0"))  # 0 = never time out
+    # Fragment coalescing: rapid messages from one author in one channel are analyzed together (0 = off)
+    coalesce_window_seconds: float = float(os.getenv("COALESCE_WINDOW_SECONDS", "2"))
+    coalesce_max_seconds: float = float(os.getenv("COALESCE_MAX_SECONDS", "8"))
+    coalesce_max_fragments: int = int(os.getenv("COALESCE_MAX_FRAGMENTS", "10"))
+    # Hearts analytics: seconds a guild's scanned hearts are reused before Firestore is read again
+    analytics_cache_ttl: int = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+    # Sharding: SHARD_COUNT > 1 runs one worker process per shard under a supervisor
+    shard_count: int = int(os.getenv("SHARD_COUNT", "0"))
+    shard_ids: List[int] = None  # populated below; shards this node runs (default: all)
+    shard_health_interval: int = int(os.getenv("SHARD_HEALTH_INTERVAL", "30"))
+    shard_start_delay: float = float(os.getenv("SHARD_START_DELAY", "5"))
+    shard_startup_timeout: int = int(os.getenv("SHARD_STARTUP_TIMEOUT", "600"))  # seconds to the first health report
+
+
+def _split_list(raw: str) -> List[str]:
+    # Comma, space or newline separated values
+    out: List[str] = []
+    for part in raw.replace("\n", ",").replace(" ", ",").split(","):
+        p = part.strip()
+        if p:
+            out.append(p)
+    return out
 
 
 def get_config() -> Config:
     discord_token = os.getenv("DISCORD_TOKEN", "").strip()
     gemini_api_key = os.getenv("GEMINI_API_KEY", "").strip()
+    gemini_api_keys = _split_list(os.getenv("GEMINI_API_KEYS", ""))
     if not discord_token:
         raise RuntimeError("DISCORD_TOKEN is not set in environment/.env")
-    if not gemini_api_key:
-        raise RuntimeError("GEMINI_API_KEY is not set in environment/.env")
-    cfg = Config(discord_token=discord_token, gemini_api_key=gemini_api_key)
+    if not gemini_api_key and not gemini_api_keys:
+        raise RuntimeError("GEMINI_API_KEY (or GEMINI_API_KEYS) is not set in environment/.env")
+    if gemini_api_key and gemini_api_key not in gemini_api_keys:
+        gemini_api_keys.insert(0, gemini_api_key)
+    cfg = Config(discord_token=discord_token, gemini_api_key=gemini_api_key or gemini_api_keys[0])
+    cfg.gemini_api_keys = gemini_api_keys
+    cfg.gemini_models = _split_list(os.getenv("GEMINI_MODELS", "gemini-2.0-flash"))
+    cfg.gemini_escalation_models = _split_list(os.getenv("GEMINI_ESCALATION_MODELS", ""))
+    # "gemini-2.5-pro=2048": thinking models count thoughts against the output cap
+    cfg.gemini_output_tokens = {}
+    for entry in _split_list(os.getenv("GEMINI_OUTPUT_TOKENS", "")):
+        model, sep, tokens = entry.partition("=")
+        if sep and tokens.strip().isdigit():
+            cfg.gemini_output_tokens[model.strip()] = int(tokens)
+    cfg.shard_ids = [int(x) for x in _split_list(os.getenv("SHARD_IDS", "")) if x.isdigit()]
     # Parse admin role IDs (comma or space separated)
-    raw = os.getenv("ADMIN_ROLE_IDS", "").strip()
-    ids: List[str] = []
-    if raw:
-        for part in raw.replace("\n", ",").replace(" ", ",").split(","):
-            p = part.strip()
-            if p:
-                ids.append(p)
-    cfg.admin_role_ids = ids
-    # Load special users from JSON file (default: specialuser.json)
+    cfg.admin_role_ids = _split_list(os.getenv("ADMIN_ROLE_IDS", "").strip())
+    # Special users are loaded later by load_special_users(), off the startup path
+    return cfg
+
+
+def load_special_users(cfg: Config) -> List[dict]:
+    """Load special users from the JSON file (default: specialuser.json) into cfg.special_users."""
     special_users: List[dict] = []
-    file_path = os.getenv("SPECIAL_USERS_FILE", "specialuser.json").strip()
+    file_path = cfg.special_users_file
     if file_path:
         try:
             with open(file_path, "r", encoding="utf-8") as f:
@@ -73,4 +144,4 @@ def get_config() -> Config:
             # invalid file, leave empty
             pass
     cfg.special_users = special_users
-    return cfg
+    return special_users
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .verdicts import changed_chars, content_hash, normalize_content
+
+
+@dataclass
+class ModeratedContent:
+    content_hash: str
+    normalized: str
+    flagged: bool
+
+
+@dataclass
+class ModeratedUnit:
+    """Coalesced fragments that were analyzed together, with the unit's verdict."""
+
+    message_ids: Tuple[int, ...]
+    contents: List[str]
+    flagged: bool
+
+    def text_with(self, message_id: int, content: str) -> str:
+        # The unit's text as it reads after this fragment's edit
+        return "\n".join(content if mid == message_id else c for mid, c in zip(self.message_ids, self.contents))
+
+    def update(self, message_id: int, content: str) -> None:
+        self.contents[self.message_ids.index(message_id)] = content
+
+
+class EditTracker:
+    """Decide which message edits are worth another Gemini call.
+
+    Keeps the last analyzed content of recent messages. An edit is re-analyzed
+    only when its normalized hash differs from that baseline by at least
+    min_changed_chars, so typo fixes are free. Small edits are compared against
+    the last analyzed version, so they cannot add up to an unchecked rewrite.
+    Rapid successive edits of one message are debounced into a single analysis.
+    Fragments of a coalesced unit also share a ModeratedUnit, so an edit can
+    be judged in the context of the other fragments.
+    """
+
+    def __init__(self, min_changed_chars: int = 3, debounce_seconds: float = 3.0, max_entries: int = 5000):
+        self.min_changed_chars = max(1, min_changed_chars)
+        self.debounce_seconds = max(0.0, debounce_seconds)
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[int, ModeratedContent]" = OrderedDict()
+        self._pending: Dict[int, asyncio.Task] = {}
+        self._units: Dict[int, ModeratedUnit] = {}
+
+    def remember(self, message_id: int, content: str, flagged: bool) -> None:
+        normalized = normalize_content(content)
+        self._seen[message_id] = ModeratedContent(content_hash(content), normalized, flagged)
+        self._seen.move_to_end(message_id)
+        while len(self._seen) > self.max_entries:
+            evicted, _ = self._seen.popitem(last=False)
+            self._units.pop(evicted, None)
+
+    def remember_unit(self, fragments: Sequence[Tuple[int, str]], flagged: bool) -> None:
+        """Baseline for a coalesced unit: the verdict belongs to the unit, not to any one fragment.
+
+        Fragments are stored as not flagged, so an edit that adds new abuse to
+        one of them is still penalized.
+        """
+        unit = ModeratedUnit(tuple(mid for mid, _ in fragments), [c for _, c in fragments], flagged)
+        for message_id, content in fragments:
+            self.remember(message_id, content, flagged=False)
+            self._units[message_id] = unit
+
+    def unit(self, message_id: int) -> Optional[ModeratedUnit]:
+        return self._units.get(message_id)
+
+    def baseline(self, message_id: int) -> Optional[ModeratedContent]:
+        return self._seen.get(message_id)
+
+    def needs_analysis(self, message_id: int, content: str, before: Optional[str] = None) -> bool:
+        base = self._seen.get(message_id)
+        if base is None:
+            if before is None:
+                return True
+            # Message analyzed before we started tracking it: its pre-edit text is the baseline
+            self.remember(message_id, before, flagged=False)
+            base = self._seen[message_id]
+        if content_hash(content) == base.content_hash:
+            return False
+        return changed_chars(base.normalized, normalize_content(content)) >= self.min_changed_chars
+
+    def debounce(self, message_id: int, callback: Callable[[], Awaitable[None]]) -> None:
+        # A newer edit replaces any analysis still waiting for the same message
+        task = self._pending.pop(message_id, None)
+        if task is not None:
+            task.cancel()
+        self._pending[message_id] = asyncio.get_running_loop().create_task(self._run_later(message_id, callback))
+
+    async def _run_later(self, message_id: int, callback: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+        except asyncio.CancelledError:
+            return
+        if self._pending.get(message_id) is asyncio.current_task():
+            del self._pending[message_id]
+        await callback()
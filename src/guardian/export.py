@@ -0,0 +1,89 @@
+from __future__ import annotations
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+EXPORT_FORMATS = ("ndjson", "csv")
+FLAG_FIELDS = [
+    "ts",
+    "guild_id",
+    "channel_id",
+    "message_id",
+    "message_ids",  # every fragment of a coalesced unit, or the dropped messages of a flood
+    "author_id",
+    "user_key",
+    "flag_id",
+    "reasons",
+    "edited",
+    "dropped",
+    "content",
+]
+
+
+def parse_time_bound(value: Optional[str], end: bool = False) -> Optional[str]:
+    """Turn 'YYYY-MM-DD' or an ISO datetime into the ISO UTC form stored in flag 'ts'.
+
+    A bare date used as an end bound covers that whole day.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        dt += timedelta(days=1)
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+def write_flags(rows: Iterable[Dict[str, Any]], out: io.TextIOBase, fmt: str) -> int:
+    """Stream flag records to a text file as NDJSON or CSV. Returns the row count."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    count = 0
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=FLAG_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+    for row in rows:
+        if writer is not None:
+            flat = dict(row)
+            flat["reasons"] = ";".join(str(r) for r in (row.get("reasons") or []))
+            flat["message_ids"] = ";".join(str(i) for i in (row.get("message_ids") or []))
+            writer.writerow(flat)
+        else:
+            out.write(json.dumps({k: row.get(k) for k in FLAG_FIELDS if k in row}, ensure_ascii=False))
+            out.write("\n")
+        count += 1
+    return count
+
+
+def export_flags_to_file(
+    store,
+    guild_id: str,
+    fmt: str = "ndjson",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    reason: Optional[str] = None,
+) -> Tuple[str, int]:
+    """Export a guild's flags into a gzip-compressed temporary file.
+
+    Rows go straight from Firestore pages to the compressor, so memory stays
+    constant regardless of how many flags the guild has. The caller owns (and
+    should delete) the returned path.
+    """
+    fd, path = tempfile.mkstemp(prefix=f"flags-{guild_id}-", suffix=f".{fmt}.gz")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            with io.TextIOWrapper(gz, encoding="utf-8", newline="") as text:
+                rows = store.stream_flags(guild_id, since=since, until=until, reason=reason)
+                count = write_flags(rows, text, fmt)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, count
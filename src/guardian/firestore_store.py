@@ -1,13 +1,21 @@
 from __future__ import annotations
 import logging
+import threading
+import time
 from dataclasses import dataclass
 from datetime import datetime, timezone, date
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 
-from google.cloud import firestore
+from .startup import PROFILE
 
 logger = logging.getLogger(__name__)
 
+
+def _firestore():
+    # google.cloud.firestore (and grpc) take a noticeable share of cold start; import on first use
+    from google.cloud import firestore
+    return firestore
+
 @dataclass
 class UserProfile:
     user_id: str
@@ -20,8 +28,27 @@ class UserProfile:
 
 class Store:
     def __init__(self, collection: str):
-        self.db = firestore.Client()
         self.collection = collection
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    @property
+    def db(self):
+        # Created on first use, or ahead of time by warm() in a background thread
+        if self._db is None:
+            with self._db_lock:
+                if self._db is None:
+                    started = time.perf_counter()
+                    self._db = _firestore().Client()
+                    PROFILE.record("firestore import + client", time.perf_counter() - started)
+        return self._db
+
+    def warm(self) -> None:
+        try:
+            self.db
+        except Exception as e:
+            # Surfaces again on first real use
+            logger.warning("Firestore client warm-up failed: %s", e)
 
     def _user_doc(self, user_id: str):
         return self.db.collection(self.collection).document(user_id)
@@ -61,7 +88,7 @@ class Store:
     def add_hearts(self, user_id: str, amount: int) -> int:
         doc_ref = self._user_doc(user_id)
 
-        @firestore.transactional
+        @_firestore().transactional
         def do_txn(transaction, ref):
             snap = ref.get(transaction=transaction)
             data = snap.to_dict() or {}
@@ -79,7 +106,7 @@ class Store:
         Does not lower hearts if they are already higher."""
         doc_ref = self._user_doc(user_id)
 
-        @firestore.transactional
+        @_firestore().transactional
         def do_txn(transaction, ref):
             snap = ref.get(transaction=transaction)
             data = snap.to_dict() or {}
@@ -95,7 +122,7 @@ class Store:
     def increment_flag(self, user_id: str) -> int:
         doc_ref = self._user_doc(user_id)
 
-        @firestore.transactional
+        @_firestore().transactional
         def do_txn(transaction, ref):
             snap = ref.get(transaction=transaction)
             data = snap.to_dict() or {}
@@ -117,7 +144,7 @@ class Store:
         today = date.today().isoformat()
         doc_ref = self._user_doc(user_id)
 
-        @firestore.transactional
+        @_firestore().transactional
         def do_txn(transaction, ref):
             snap = ref.get(transaction=transaction)
             data = snap.to_dict() or {}
@@ -160,10 +187,73 @@ class Store:
         q = (
             self.db.collection(self.collection)
             .where("guild_id", "==", guild_id)
-            .order_by("hearts", direction=firestore.Query.DESCENDING)
+            .order_by("hearts", direction=_firestore().Query.DESCENDING)
             .limit(limit)
         )
         out: List[Tuple[str, Dict[str, Any]]] = []
         for doc in q.stream():
             out.append((doc.id, doc.to_dict() or {}))
         return out
+
+    def iter_guild_hearts(self, guild_id: str, page_size: int = 500) -> Iterator[List[Tuple[str, int]]]:
+        """Yield pages of (doc_id, hearts) for every user of a guild, ordered by document id.
+
+        Only the hearts field is fetched, and one page is held in memory at a time.
+        """
+        fs = _firestore()
+        q = (
+            self.db.collection(self.collection)
+            .where("guild_id", "==", guild_id)
+            .select(["hearts"])
+            .order_by(fs.FieldPath.document_id())
+        )
+        last = None
+        while True:
+            page = q.limit(page_size)
+            if last is not None:
+                page = page.start_after(last)
+            docs = list(page.stream())
+            if docs:
+                yield [(doc.id, int((doc.to_dict() or {}).get("hearts", 0))) for doc in docs]
+            if len(docs) < page_size:
+                return
+            last = docs[-1]
+
+    def stream_flags(
+        self,
+        guild_id: str,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        reason: Optional[str] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield a guild's flag records in timestamp order, one page in memory at a time.
+
+        Uses a collection-group query over every user's 'flags' subcollection with
+        cursor pagination. since/until are ISO timestamps (until is exclusive).
+        Requires a collection-group index on flags(guild_id, ts), plus reasons
+        (array-contains) when filtering by reason.
+        """
+        q = self.db.collection_group("flags").where("guild_id", "==", guild_id)
+        if since:
+            q = q.where("ts", ">=", since)
+        if until:
+            q = q.where("ts", "<", until)
+        if reason:
+            q = q.where("reasons", "array_contains", reason)
+        q = q.order_by("ts")
+        last = None
+        while True:
+            page = q.limit(page_size)
+            if last is not None:
+                page = page.start_after(last)
+            docs = list(page.stream())
+            for doc in docs:
+                user_ref = doc.reference.parent.parent
+                # Collection groups span the whole database; keep only this bot's collection
+                if user_ref is None or user_ref.parent.id != self.collection:
+                    continue
+                yield {"flag_id": doc.id, "user_key": user_ref.id, **(doc.to_dict() or {})}
+            if len(docs) < page_size:
+                return
+            last = docs[-1]
@@ -0,0 +1,149 @@
+from __future__ import annotations
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Tuple
+
+from .verdicts import content_hash
+
+logger = logging.getLogger(__name__)
+
+ALLOW = None
+DROP_USER_RATE = "user_rate"
+DROP_DUPLICATE = "duplicate"
+
+
+@dataclass
+class _UserWindow:
+    times: Deque[float] = field(default_factory=deque)
+    recent: Deque[List] = field(default_factory=deque)  # [ts, content hash, flagged]
+
+
+@dataclass
+class FloodOffence:
+    """Messages dropped from one user's flood, penalized once when the flood ends."""
+
+    guild_id: int
+    author_id: int
+    channel_id: int
+    first_seen: float
+    last_seen: float
+    dropped: int = 0
+    message_ids: List[int] = field(default_factory=list)
+    contents: List[str] = field(default_factory=list)  # dropped text, analyzed in one call when settled
+    timed_out: bool = False
+
+
+class FloodGuard:
+    """In-memory sliding-window throttle that runs before any external call.
+
+    Per user: more than user_max messages within user_window seconds are
+    dropped, as are repeats of a clean message the user sent within
+    duplicate_window (repeats of a flagged message, see mark_flagged, go
+    through so each one is penalized). Rate drops accumulate into one
+    FloodOffence per user, which the caller settles with a single penalty.
+
+    Per channel, more than channel_max messages within channel_window seconds
+    only logs a surge warning. Nothing is dropped for channel volume: a user
+    under their own limit is always moderated, and repeated raid text is
+    already cheap through the verdict cache.
+    """
+
+    MAX_SAMPLE_IDS = 50
+    MAX_SAMPLE_CHARS = 4000
+
+    def __init__(
+        self,
+        user_max: int = 10,
+        user_window: float = 5.0,
+        channel_max: int = 30,
+        channel_window: float = 5.0,
+        duplicate_window: float = 30.0,
+        max_tracked: int = 10000,
+    ):
+        self.user_max = user_max
+        self.user_window = user_window
+        self.channel_max = channel_max
+        self.channel_window = channel_window
+        self.duplicate_window = duplicate_window
+        self.max_tracked = max_tracked
+        self._users: "OrderedDict[Tuple[int, int], _UserWindow]" = OrderedDict()
+        self._channels: "OrderedDict[int, Deque[float]]" = OrderedDict()
+        self.offences: dict[Tuple[int, int], FloodOffence] = {}
+        self._surging: set[int] = set()
+
+    def _touch(self, table: OrderedDict, key, factory):
+        item = table.get(key)
+        if item is None:
+            item = table[key] = factory()
+            while len(table) > self.max_tracked:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return item
+
+    @staticmethod
+    def _expire(times: Deque[float], now: float, window: float) -> None:
+        while times and now - times[0] >= window:
+            times.popleft()
+
+    def check(self, guild_id: int, channel_id: int, author_id: int, message_id: int, content: str, now: Optional[float] = None) -> Optional[str]:
+        """Return None to let the message through, else the reason it was dropped."""
+        now = time.monotonic() if now is None else now
+        if self.channel_max > 0:
+            chan = self._touch(self._channels, channel_id, deque)
+            self._expire(chan, now, self.channel_window)
+            chan.append(now)
+            if len(chan) > self.channel_max:
+                if channel_id not in self._surging:
+                    self._surging.add(channel_id)
+                    logger.warning(
+                        f"Channel {channel_id} passed {self.channel_max} messages in {self.channel_window:g}s; "
+                        f"possible raid (messages are still moderated)"
+                    )
+            else:
+                self._surging.discard(channel_id)
+
+        user = self._touch(self._users, (guild_id, author_id), _UserWindow)
+        self._expire(user.times, now, self.user_window)
+        while user.recent and now - user.recent[0][0] >= self.duplicate_window:
+            user.recent.popleft()
+        user.times.append(now)
+        if self.user_max > 0 and len(user.times) > self.user_max:
+            offence = self.offences.get((guild_id, author_id))
+            if offence is None:
+                offence = self.offences[(guild_id, author_id)] = FloodOffence(
+                    guild_id=guild_id, author_id=author_id, channel_id=channel_id, first_seen=now, last_seen=now
+                )
+            offence.dropped += 1
+            offence.last_seen = now
+            offence.channel_id = channel_id
+            if len(offence.message_ids) < self.MAX_SAMPLE_IDS:
+                offence.message_ids.append(message_id)
+                if content and sum(len(c) for c in offence.contents) < self.MAX_SAMPLE_CHARS:
+                    offence.contents.append(content)
+            return DROP_USER_RATE
+        digest = content_hash(content)
+        if content and any(h == digest and not flagged for _, h, flagged in user.recent):
+            return DROP_DUPLICATE
+        user.recent.append([now, digest, False])
+        return ALLOW
+
+    def mark_flagged(self, guild_id: int, author_id: int, content: str) -> None:
+        """Record that the user's recent message was flagged, so its repeats are analyzed (and penalized) too."""
+        user = self._users.get((guild_id, author_id))
+        if user is None:
+            return
+        digest = content_hash(content)
+        for entry in user.recent:
+            if entry[1] == digest:
+                entry[2] = True
+
+    def settle(self, guild_id: int, author_id: int, now: Optional[float] = None) -> Optional[FloodOffence]:
+        """Pop the user's offence once the flood has been quiet for a full window."""
+        now = time.monotonic() if now is None else now
+        offence = self.offences.get((guild_id, author_id))
+        if offence is None or now - offence.last_seen < self.user_window:
+            return None
+        return self.offences.pop((guild_id, author_id))
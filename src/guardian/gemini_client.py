@@ -1,11 +1,12 @@
 import json
 import logging
-import requests
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
 
-GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+DEFAULT_MODEL = "gemini-2.0-flash"
+GEMINI_URL = f"{GEMINI_API_BASE}/{DEFAULT_MODEL}:generateContent"
 
 PROMPT_TEMPLATE = (
     "You are a content moderation and positivity detector for a Discord server.\n"
@@ -21,13 +22,69 @@ PROMPT_TEMPLATE = (
     "Message: \n" 
 )
 
+# Moderation-only prompt for messages without a helper candidate: problem_solved/praise
+# can only reward a replied-to or mentioned member, so they are not asked for.
+PROMPT_MODERATION = (
+    "You are a content moderator for a Discord server.\n"
+    "Classify the message and return STRICT JSON: \n"
+    "{\"flagged\": boolean, // harmful/abusive/profane\n"
+    " \"reasons\": string[], // e.g. ['abuse','profanity','harassment']\n"
+    " \"good_advice\": boolean} // polite, helpful advice\n"
+    "Only raw JSON.\n"
+    "Message: \n"
+)
+
+VARIANT_MODERATION = "moderation"
+VARIANT_REWARD = "reward"
+
+# variant -> (prompt, maxOutputTokens); sized for non-thinking models, override per model for thinking ones
+PROMPT_VARIANTS: Dict[str, Tuple[str, int]] = {
+    VARIANT_MODERATION: (PROMPT_MODERATION, 64),
+    VARIANT_REWARD: (PROMPT_TEMPLATE, 128),
+}
+
+DEFAULT_MAX_INPUT_CHARS = 1500
+
+
+class GeminiOutputError(ValueError):
+    """Gemini answered, but not with a usable verdict (no output, or output that is not a JSON object)."""
+
 
-def analyze_message(api_key: str, text: str) -> Dict[str, Any]:
-    payload = {
+def cap_text(text: str, max_chars: int = DEFAULT_MAX_INPUT_CHARS) -> str:
+    # Keep the head and tail of very long messages; abuse rarely hides only in the middle
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return text[:head] + "\n[...]\n" + text[-tail:]
+
+
+def model_url(model: str) -> str:
+    return f"{GEMINI_API_BASE}/{model}:generateContent"
+
+
+def model_stream_url(model: str) -> str:
+    return f"{GEMINI_API_BASE}/{model}:streamGenerateContent?alt=sse"
+
+
+def default_result() -> Dict[str, Any]:
+    return {
+        "flagged": False,
+        "reasons": [],
+        "good_advice": False,
+        "problem_solved": False,
+        "praise": False,
+    }
+
+
+def _build_payload(text: str, variant: str, max_input_chars: int, max_output_tokens: int | None = None) -> Dict[str, Any]:
+    prompt, default_output_tokens = PROMPT_VARIANTS[variant]
+    max_output_tokens = max_output_tokens or default_output_tokens
+    return {
         "contents": [
             {
                 "parts": [
-                    {"text": PROMPT_TEMPLATE + text}
+                    {"text": prompt + cap_text(text, max_input_chars)}
                 ]
             }
         ],
@@ -35,47 +92,206 @@ def analyze_message(api_key: str, text: str) -> Dict[str, Any]:
             "temperature": 0,
             "topP": 0.1,
             "topK": 32,
-            "maxOutputTokens": 256,
+            "maxOutputTokens": max_output_tokens,
             "responseMimeType": "application/json"
         }
     }
+
+
+def _usage(data: Dict[str, Any]) -> Dict[str, int]:
+    meta = data.get("usageMetadata") or {}
+    return {
+        "input_tokens": int(meta.get("promptTokenCount", 0) or 0),
+        "output_tokens": int(meta.get("candidatesTokenCount", 0) or 0),
+    }
+
+
+def _parse_verdict(text_out: str | None) -> Dict[str, Any]:
+    # Raise rather than default to "not flagged": callers must not mistake a broken reply for a verdict
+    if not text_out:
+        raise GeminiOutputError("Gemini returned no output")
+    try:
+        parsed = json.loads(text_out)
+    except json.JSONDecodeError:
+        raise GeminiOutputError(f"Gemini returned non-JSON output: {text_out[:100]!r}") from None
+    if not isinstance(parsed, dict) or "flagged" not in parsed:
+        raise GeminiOutputError(f"Gemini returned no verdict: {text_out[:100]!r}")
+    result = default_result()
+    result.update({
+        "flagged": bool(parsed.get("flagged", False)),
+        "reasons": list(parsed.get("reasons", []) or []),
+        "good_advice": bool(parsed.get("good_advice", False)),
+        "problem_solved": bool(parsed.get("problem_solved", False)),
+        "praise": bool(parsed.get("praise", False)),
+    })
+    return result
+
+
+def _check_finish(data: Dict[str, Any]) -> None:
+    # A reply cut off at maxOutputTokens (thinking models spend it on thoughts) is not a verdict
+    try:
+        finish = data["candidates"][0].get("finishReason")
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return
+    if finish == "MAX_TOKENS":
+        raise GeminiOutputError("Gemini output hit maxOutputTokens; raise GEMINI_OUTPUT_TOKENS for this model")
+
+
+def _output_text(data: Dict[str, Any]) -> str | None:
+    # Concatenate the answer parts of the first candidate, skipping any thought summaries
+    try:
+        parts = data["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        return None
+    return "".join(p.get("text", "") for p in parts if not p.get("thought")) or None
+
+
+def generate(
+    api_key: str,
+    text: str,
+    url: str = GEMINI_URL,
+    timeout: float = 15,
+    variant: str = VARIANT_REWARD,
+    max_input_chars: int = DEFAULT_MAX_INPUT_CHARS,
+    max_output_tokens: int | None = None,
+) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """Classify text with a single generateContent call.
+
+    Returns the verdict and the token usage reported by Gemini. Unlike
+    analyze_message, HTTP and network errors are raised so callers (e.g. the
+    router) can account for failing keys, and so is GeminiOutputError when the
+    reply holds no parseable verdict or was truncated at max_output_tokens
+    (default: the variant's cap).
+    """
+    payload = _build_payload(text, variant, max_input_chars, max_output_tokens)
+    headers = {
+        "Content-Type": "application/json",
+        "X-goog-api-key": api_key,
+    }
+    import requests  # deferred to keep cold start short; cached after the first call
+
+    res = requests.post(url, headers=headers, json=payload, timeout=timeout)
+    res.raise_for_status()
+    data = res.json()
+    # The response JSON may include candidates -> content -> parts -> text
+    _check_finish(data)
+    return _parse_verdict(_output_text(data)), _usage(data)
+
+
+class IncrementalJSONFields:
+    """Pull completed top-level members out of a JSON object as its text streams in.
+
+    feed() returns the (name, value) pairs completed by the new chunk, so
+    {"flagged": true, ... is reported as soon as the comma after true arrives.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: int | None = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.buf += chunk
+        out: List[Tuple[str, Any]] = []
+        while self._pos < len(self.buf):
+            ch = self.buf[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._pos + 1
+            elif ch in "}]":
+                if self._depth == 1:
+                    self._emit(self._pos, out)
+                self._depth -= 1
+                if self._depth == 1:
+                    # A nested array/object value just closed: the member is complete
+                    self._emit(self._pos + 1, out)
+            elif ch == "," and self._depth == 1:
+                self._emit(self._pos, out)
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return out
+
+    def _emit(self, end: int, out: List[Tuple[str, Any]]) -> None:
+        if self._member_start is None:
+            return
+        member = self.buf[self._member_start:end].strip()
+        self._member_start = None
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return
+        out.extend(parsed.items())
+
+
+def generate_stream(
+    api_key: str,
+    text: str,
+    url: str,
+    timeout: float = 15,
+    variant: str = VARIANT_REWARD,
+    max_input_chars: int = DEFAULT_MAX_INPUT_CHARS,
+    on_field: Callable[[str, Any], None] | None = None,
+    max_output_tokens: int | None = None,
+) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """Like generate(), but over streamGenerateContent (SSE).
+
+    on_field(name, value) is called from this thread for each top-level verdict
+    field as soon as it is complete, before the rest of the output arrives.
+    url must be a streamGenerateContent endpoint with alt=sse.
+    """
+    payload = _build_payload(text, variant, max_input_chars, max_output_tokens)
     headers = {
         "Content-Type": "application/json",
         "X-goog-api-key": api_key,
     }
-    try:
-        res = requests.post(GEMINI_URL, headers=headers, json=payload, timeout=15)
+    import requests
+
+    parser = IncrementalJSONFields()
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    with requests.post(url, headers=headers, json=payload, timeout=timeout, stream=True) as res:
         res.raise_for_status()
-        data = res.json()
-        # The response JSON may include candidates -> content -> parts -> text
-        text_out = None
-        try:
-            text_out = data["candidates"][0]["content"]["parts"][0]["text"]
-        except Exception:
-            # Fallback to raw
-            text_out = json.dumps(data)
-        result = {
-            "flagged": False,
-            "reasons": [],
-            "good_advice": False,
-            "problem_solved": False,
-            "praise": False,
-        }
-        if text_out:
+        for line in res.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = json.loads(line[5:])
+            if data.get("usageMetadata"):
+                usage = _usage(data)
+            _check_finish(data)
             try:
-                parsed = json.loads(text_out)
-                result.update({
-                    "flagged": bool(parsed.get("flagged", False)),
-                    "reasons": list(parsed.get("reasons", []) or []),
-                    "good_advice": bool(parsed.get("good_advice", False)),
-                    "problem_solved": bool(parsed.get("problem_solved", False)),
-                    "praise": bool(parsed.get("praise", False)),
-                })
-            except json.JSONDecodeError:
-                logger.warning("Gemini non-JSON output, treating as not flagged")
-        return result
+                parts = data["candidates"][0]["content"]["parts"]
+            except (KeyError, IndexError, TypeError):
+                continue
+            for part in parts:
+                if part.get("thought"):
+                    continue
+                for name, value in parser.feed(part.get("text", "")):
+                    if on_field is not None:
+                        on_field(name, value)
+    return _parse_verdict(parser.buf), usage
+
+
+def analyze_message(api_key: str, text: str, url: str = GEMINI_URL, variant: str = VARIANT_REWARD) -> Dict[str, Any]:
+    import requests
+
+    try:
+        return generate(api_key, text, url=url, variant=variant)[0]
     except requests.HTTPError as e:
         logger.error("Gemini API HTTP error: %s", e)
     except Exception as e:
         logger.error("Gemini API error: %s", e)
-    return {"flagged": False, "reasons": [], "good_advice": False, "problem_solved": False}
+    return default_result()
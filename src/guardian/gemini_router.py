@@ -0,0 +1,359 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+from .gemini_client import (
+    DEFAULT_MAX_INPUT_CHARS,
+    VARIANT_MODERATION,
+    VARIANT_REWARD,
+    default_result,
+    generate,
+    generate_stream,
+    model_stream_url,
+    model_url,
+)
+from .verdicts import VerdictCache, content_hash
+
+logger = logging.getLogger(__name__)
+
+TIER_PRIMARY = "primary"
+TIER_ESCALATION = "escalation"
+
+
+def _parse_weighted(entry: str) -> tuple[str, int]:
+    # "gemini-2.0-flash:3" -> ("gemini-2.0-flash", 3)
+    name, sep, weight = entry.rpartition(":")
+    if sep and weight.isdigit():
+        return name, max(1, int(weight))
+    return entry, 1
+
+
+@dataclass
+class RouteStats:
+    requests: int = 0
+    errors: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_error: Optional[str] = None
+
+    @property
+    def avg_latency(self) -> float:
+        ok = self.requests - self.errors
+        return self.total_latency / ok if ok > 0 else 0.0
+
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass
+class GeminiRoute:
+    api_key: str
+    key_index: int
+    model: str
+    tier: str = TIER_PRIMARY
+    weight: int = 1
+    max_output_tokens: Optional[int] = None  # None: the prompt variant's default cap
+    inflight: int = 0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    stats: RouteStats = field(default_factory=RouteStats)
+    recent: Deque[float] = field(default_factory=deque)  # request times in the last minute
+
+    def load(self, now: float) -> int:
+        # Own last-minute requests plus in-flight ones; routes sharing a key are scored independently
+        while self.recent and now - self.recent[0] >= 60.0:
+            self.recent.popleft()
+        return self.inflight + len(self.recent)
+
+    @property
+    def name(self) -> str:
+        # Keys are identified by position in the pool, never by value
+        return f"{self.model}@key{self.key_index}"
+
+    @property
+    def url(self) -> str:
+        return model_url(self.model)
+
+    @property
+    def stream_url(self) -> str:
+        return model_stream_url(self.model)
+
+
+class KeyQuota:
+    """Sliding one-minute request window for a single API key.
+
+    A key is shared by every model routed through it, so quota is tracked per
+    key rather than per route. It only gates availability; load balancing
+    uses each route's own window. rpm=0 disables the limit.
+    """
+
+    def __init__(self, rpm: int = 0):
+        self.rpm = rpm
+        self.window: Deque[float] = deque()
+        self.blocked_until = 0.0
+
+    def usage(self, now: float) -> int:
+        while self.window and now - self.window[0] >= 60.0:
+            self.window.popleft()
+        return len(self.window)
+
+    def available(self, now: float) -> bool:
+        if now < self.blocked_until:
+            return False
+        return self.rpm <= 0 or self.usage(now) < self.rpm
+
+    def consume(self, now: float) -> None:
+        self.window.append(now)
+
+
+class GeminiRouter:
+    """Spread Gemini analysis over a pool of API keys and models.
+
+    Routes are picked least-loaded first (the route's own in-flight plus
+    last-minute requests, divided by weight), with round-robin among ties, so
+    traffic is shared in proportion to the weights. Keys that keep failing are
+    ejected for a cooldown, and a key answering 429 is paused as a whole. When
+    escalation models are configured, a message flagged by the primary tier is
+    re-checked by the escalation tier and that verdict wins.
+    """
+
+    def __init__(
+        self,
+        api_keys: Iterable[str],
+        models: Iterable[str],
+        escalation_models: Iterable[str] = (),
+        *,
+        rpm_per_key: int = 0,
+        eject_after: int = 3,
+        eject_seconds: float = 60.0,
+        timeout: float = 15.0,
+        cache: Optional[VerdictCache] = None,
+        max_input_chars: int = DEFAULT_MAX_INPUT_CHARS,
+        output_tokens: Optional[Dict[str, int]] = None,
+    ):
+        keys = list(dict.fromkeys(k for k in api_keys if k))
+        if not keys:
+            raise ValueError("GeminiRouter needs at least one API key")
+        self.routes: List[GeminiRoute] = []
+        for tier, entries in ((TIER_PRIMARY, models), (TIER_ESCALATION, escalation_models)):
+            for entry in entries:
+                model, weight = _parse_weighted(entry)
+                for idx, key in enumerate(keys, start=1):
+                    self.routes.append(GeminiRoute(
+                        api_key=key,
+                        key_index=idx,
+                        model=model,
+                        tier=tier,
+                        weight=weight,
+                        max_output_tokens=(output_tokens or {}).get(model),
+                    ))
+        if not any(r.tier == TIER_PRIMARY for r in self.routes):
+            raise ValueError("GeminiRouter needs at least one primary model")
+        self.quotas: Dict[str, KeyQuota] = {k: KeyQuota(rpm_per_key) for k in keys}
+        self.eject_after = max(1, eject_after)
+        self.eject_seconds = eject_seconds
+        self.timeout = timeout
+        self.cache = cache
+        self.max_input_chars = max_input_chars
+        self.usage: Dict[str, TokenUsage] = {v: TokenUsage() for v in (VARIANT_MODERATION, VARIANT_REWARD)}
+        self._rr = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg) -> "GeminiRouter":
+        return cls(
+            cfg.gemini_api_keys or [cfg.gemini_api_key],
+            cfg.gemini_models or ["gemini-2.0-flash"],
+            cfg.gemini_escalation_models or [],
+            rpm_per_key=cfg.gemini_key_rpm,
+            eject_after=cfg.gemini_eject_after,
+            eject_seconds=cfg.gemini_eject_seconds,
+            cache=VerdictCache(cfg.verdict_cache_size, cfg.verdict_cache_ttl),
+            max_input_chars=cfg.gemini_max_input_chars,
+            output_tokens=cfg.gemini_output_tokens,
+        )
+
+    @property
+    def has_escalation(self) -> bool:
+        return any(r.tier == TIER_ESCALATION for r in self.routes)
+
+    def _acquire(self, tier: str, tried: set) -> Optional[GeminiRoute]:
+        # Pick the least-loaded healthy route of a tier and reserve it
+        with self._lock:
+            now = time.monotonic()
+            candidates = [
+                r for r in self.routes
+                if r.tier == tier
+                and id(r) not in tried
+                and now >= r.ejected_until
+                and self.quotas[r.api_key].available(now)
+            ]
+            if not candidates:
+                return None
+            # Rotate start position so equal scores are served round-robin
+            self._rr = (self._rr + 1) % len(candidates)
+            rotated = candidates[self._rr:] + candidates[:self._rr]
+            route = min(rotated, key=lambda r: (r.load(now) + 1) / r.weight)
+            route.inflight += 1
+            route.recent.append(now)
+            self.quotas[route.api_key].consume(now)
+            return route
+
+    def _release(self, route: GeminiRoute, latency: float, error: Optional[Exception]) -> None:
+        with self._lock:
+            route.inflight -= 1
+            route.stats.requests += 1
+            if error is None:
+                route.consecutive_failures = 0
+                route.stats.total_latency += latency
+                route.stats.max_latency = max(route.stats.max_latency, latency)
+                return
+            route.stats.errors += 1
+            route.stats.last_error = str(error)[:200]
+            route.consecutive_failures += 1
+            now = time.monotonic()
+            status = getattr(getattr(error, "response", None), "status_code", None)
+            if status == 429:
+                # Quota exhausted: pause every route sharing this key
+                self.quotas[route.api_key].blocked_until = now + self.eject_seconds
+                logger.warning("Gemini key%s rate limited; pausing for %ss", route.key_index, self.eject_seconds)
+            elif route.consecutive_failures >= self.eject_after:
+                route.ejected_until = now + self.eject_seconds
+                route.consecutive_failures = 0
+                logger.warning("Ejecting Gemini route %s for %ss after repeated failures", route.name, self.eject_seconds)
+
+    def _analyze_tier(
+        self,
+        tier: str,
+        text: str,
+        variant: str,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        # Fail over to other routes of the same tier until one answers
+        tried: set = set()
+        while True:
+            route = self._acquire(tier, tried)
+            if route is None:
+                return None
+            tried.add(id(route))
+            started = time.perf_counter()
+            try:
+                if on_field is not None:
+                    result, usage = generate_stream(
+                        route.api_key,
+                        text,
+                        url=route.stream_url,
+                        timeout=self.timeout,
+                        variant=variant,
+                        max_input_chars=self.max_input_chars,
+                        on_field=on_field,
+                        max_output_tokens=route.max_output_tokens,
+                    )
+                else:
+                    result, usage = generate(
+                        route.api_key,
+                        text,
+                        url=route.url,
+                        timeout=self.timeout,
+                        variant=variant,
+                        max_input_chars=self.max_input_chars,
+                        max_output_tokens=route.max_output_tokens,
+                    )
+            except Exception as e:
+                self._release(route, time.perf_counter() - started, e)
+                if getattr(e, "response", None) is not None:
+                    logger.error("Gemini API HTTP error on %s: %s", route.name, e)
+                else:
+                    logger.error("Gemini API error on %s: %s", route.name, e)
+                continue
+            self._release(route, time.perf_counter() - started, None)
+            with self._lock:
+                tally = self.usage[variant]
+                tally.calls += 1
+                tally.input_tokens += usage["input_tokens"]
+                tally.output_tokens += usage["output_tokens"]
+            return result
+
+    def analyze(
+        self,
+        text: str,
+        variant: str = VARIANT_REWARD,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Dict[str, Any]:
+        """Classify text. The moderation variant skips the reward-only fields.
+
+        With on_field, the primary tier streams its answer and reports each
+        verdict field as soon as it is complete. Early fields are not reported
+        when escalation models are configured, because the escalation verdict
+        may overrule them. A field may be reported twice if a route fails
+        mid-stream and another route answers.
+        """
+        if on_field is not None and self.has_escalation:
+            on_field = None
+        digest = content_hash(text)
+        key = f"{variant}:{digest}"
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is None and variant == VARIANT_MODERATION:
+                # A full reward verdict answers a moderation-only question too
+                cached = self.cache.get(f"{VARIANT_REWARD}:{digest}")
+            if cached is not None:
+                return cached
+        result = self._analyze_tier(TIER_PRIMARY, text, variant, on_field)
+        if result is None:
+            logger.error("No healthy Gemini route available, treating message as not flagged")
+            return default_result()
+        if result.get("flagged") and self.has_escalation:
+            # Only a parsed escalation verdict may overrule; if every escalation route fails, the flag stands
+            escalated = self._analyze_tier(TIER_ESCALATION, text, variant)
+            if escalated is not None:
+                result = escalated
+            else:
+                logger.warning("Escalation tier gave no verdict; keeping the primary flag")
+        if self.cache is not None:
+            self.cache.put(key, result)
+        return result
+
+    def token_stats(self) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            for variant, t in self.usage.items():
+                out.append({
+                    "variant": variant,
+                    "calls": t.calls,
+                    "input_tokens": t.input_tokens,
+                    "output_tokens": t.output_tokens,
+                    "avg_input_tokens": round(t.input_tokens / t.calls, 1) if t.calls else 0.0,
+                    "avg_output_tokens": round(t.output_tokens / t.calls, 1) if t.calls else 0.0,
+                })
+        return out
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            for r in self.routes:
+                s = r.stats
+                out.append({
+                    "route": r.name,
+                    "tier": r.tier,
+                    "weight": r.weight,
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "error_rate": (s.errors / s.requests) if s.requests else 0.0,
+                    "avg_latency_ms": round(s.avg_latency * 1000, 1),
+                    "max_latency_ms": round(s.max_latency * 1000, 1),
+                    "inflight": r.inflight,
+                    "key_rpm_used": self.quotas[r.api_key].usage(now),
+                    "ejected": now < r.ejected_until or now < self.quotas[r.api_key].blocked_until,
+                    "last_error": s.last_error,
+                })
+        return out
@@ -1,15 +1,35 @@
+import time
+
+_IMPORTS_STARTED = time.perf_counter()
+
+import argparse
 import asyncio
+import json
 import logging
 import os
+import threading
+from collections import Counter
+from datetime import timedelta
 from typing import Optional
 
 import discord
 from discord import app_commands
 
-from .config import get_config
-from .roles import role_for_hearts, ordered_roles, role_color
-from .gemini_client import analyze_message
+from .startup import PROFILE
+from .coalesce import FragmentCoalescer
+from .config import get_config, load_special_users
+from .edits import EditTracker
+from .export import EXPORT_FORMATS, export_flags_to_file, parse_time_bound
+from .flood import DROP_USER_RATE, FloodGuard
+from .roles import parse_roles, role_for_hearts, ordered_roles, role_color
+from .gemini_client import VARIANT_MODERATION, VARIANT_REWARD
+from .gemini_router import GeminiRouter
+from .memory import MemberLRU, resident_memory_bytes
+from .role_sweep import RoleSweeper
 from .firestore_store import Store
+from .sharding import ShardHealth, run_supervisor, shard_for_guild
+
+PROFILE.record("imports (discord, bot modules)", time.perf_counter() - _IMPORTS_STARTED)
 
 
 def setup_logging(level: str):
@@ -20,16 +40,143 @@ def setup_logging(level: str):
 
 
 class GuardianClient(discord.Client):
-    def __init__(self, *, intents: discord.Intents, store: Store, config):
-        super().__init__(intents=intents)
+    def __init__(
+        self,
+        *,
+        intents: discord.Intents,
+        store: Store,
+        config,
+        router: GeminiRouter | None = None,
+        health_queue=None,
+        **client_kwargs,
+    ):
+        # client_kwargs carries shard_id/shard_count when running as one shard of a sharded deployment
+        super().__init__(intents=intents, **client_kwargs)
         self.store = store
         self.config = config
+        self.router = router or GeminiRouter.from_config(config)
+        self.health = ShardHealth(shard_id=self.shard_id)
+        self.health_queue = health_queue
+        self.edits = EditTracker(config.edit_min_changed_chars, config.edit_debounce_seconds)
+        self.flood = FloodGuard(
+            user_max=config.flood_user_max,
+            user_window=config.flood_user_window,
+            channel_max=config.flood_channel_max,
+            channel_window=config.flood_channel_window,
+            duplicate_window=config.flood_duplicate_window,
+        )
+        # Bursts of short messages are analyzed as one unit; None handles every message on its own
+        self.coalescer = None
+        if config.coalesce_window_seconds > 0:
+            self.coalescer = FragmentCoalescer(
+                self.handle_unit,
+                window=config.coalesce_window_seconds,
+                max_wait=config.coalesce_max_seconds,
+                max_fragments=config.coalesce_max_fragments,
+                max_chars=config.gemini_max_input_chars,
+            )
+        self._analytics = None
+        # ensure_roles runs from on_ready and the role sweep; serialize it per guild
+        self._role_locks: dict[int, asyncio.Lock] = {}
+        self._created_roles: set[tuple[int, str]] = set()
+        # Only consulted in low-memory mode, where discord.py keeps no member cache
+        self.members = MemberLRU(config.member_lru_size)
         self.logger = logging.getLogger("guardian")
         self.tree = app_commands.CommandTree(self)
+        # Special user lookups are filled in setup_hook, once the file has been read
+        self._special_ids: set[str] = set()
+        self._special_role_ids: set[str] = set()
+        self._login_done: float | None = None
+
+    @property
+    def analytics(self):
+        # Created on first use: the analytics module may pull in numpy, which startup should not pay for
+        if self._analytics is None:
+            from .analytics import AnalyticsCache
+
+            self._analytics = AnalyticsCache(self.store, ttl_seconds=self.config.analytics_cache_ttl)
+        return self._analytics
+
+    async def login(self, token: str) -> None:
+        started = time.perf_counter()
+        await super().login(token)
+        self._login_done = time.perf_counter()
+        PROFILE.record("discord login", self._login_done - started)
+
+    async def setup_hook(self):
+        if self.config.special_users is None:
+            with PROFILE.phase("special users file"):
+                await asyncio.to_thread(load_special_users, self.config)
         # Build quick lookup for special users and special role IDs
         specials = (self.config.special_users or [])
         self._special_ids = set(str(u.get("id")) for u in specials if u.get("id"))
         self._special_role_ids = set(str(u.get("roleId")) for u in specials if u.get("roleId"))
+        if self.health_queue is not None:
+            self.loop.create_task(self._report_health())
+        if self.config.memory_report_interval > 0:
+            self.loop.create_task(self._report_memory())
+        if self.config.role_sweep_interval > 0:
+            sweeper = RoleSweeper(
+                self,
+                interval=self.config.role_sweep_interval,
+                page_size=self.config.role_sweep_page_size,
+                workers=self.config.role_sweep_workers,
+                ops_per_second=self.config.role_sweep_ops_per_second,
+            )
+            self.loop.create_task(sweeper.run_forever())
+
+    def memory_report(self) -> list[str]:
+        rss = resident_memory_bytes()
+        guilds = self.guilds
+        lines = []
+        if rss is not None:
+            # Process-wide; RSS cannot be attributed to a guild, so this is only an average
+            average = rss / max(1, len(guilds))
+            lines.append(f"RSS {rss / 2**20:.1f} MiB across {len(guilds)} guild(s) (average {average / 2**20:.1f} MiB per guild)")
+        # What each guild actually holds in memory: cached members, member LRU entries and cached messages
+        lru_counts = self.members.counts_by_guild()
+        message_counts = Counter(m.guild.id for m in self.cached_messages if m.guild is not None)
+        for guild in guilds:
+            lines.append(
+                f"Guild '{guild.name}' ({guild.id}): {len(guild.members)} cached / {guild.member_count or 0} members, "
+                f"{lru_counts.get(guild.id, 0)} in member LRU, {message_counts.get(guild.id, 0)} cached message(s)"
+            )
+        lines.append(f"Message cache: {len(self.cached_messages)} message(s) in total")
+        lines.append(
+            f"Member LRU: {len(self.members)}/{self.members.max_entries} entries, "
+            f"{self.members.hits} hit(s), {self.members.fetches} HTTP fetch(es)"
+        )
+        return lines
+
+    async def _report_memory(self):
+        await self.wait_until_ready()
+        while not self.is_closed():
+            await asyncio.sleep(self.config.memory_report_interval)
+            for line in self.memory_report():
+                self.logger.info(line)
+
+    async def _report_health(self):
+        # Periodically publish this shard's health to the supervisor
+        await self.wait_until_ready()
+        interval = max(1, int(self.config.shard_health_interval))
+        while not self.is_closed():
+            snapshot = self.health.snapshot(
+                guilds=len(self.guilds),
+                gateway_latency=self.latency,
+                ready=self.is_ready(),
+                rss_bytes=resident_memory_bytes(),
+            )
+            try:
+                self.health_queue.put_nowait(snapshot)
+            except Exception as e:
+                self.logger.debug(f"Failed to publish shard health: {e}")
+            await asyncio.sleep(interval)
+
+    def owns_guild(self, guild_id: int) -> bool:
+        # Per-user state is keyed by guild, so only the shard owning a guild may write it
+        if self.shard_count is None or self.shard_id is None:
+            return True
+        return shard_for_guild(guild_id, self.shard_count) == self.shard_id
 
     def is_admin(self, member: discord.Member) -> bool:
         # Admin if they have Administrator permission OR any of the configured admin roles
@@ -45,12 +192,26 @@ class GuardianClient(discord.Client):
 
     async def on_ready(self):
         self.logger.info(f"Logged in as {self.user} (id={self.user.id})")
-        # Ensure roles exist on all guilds where the bot is present
+        if self._login_done is not None:
+            PROFILE.record("gateway connect to ready", time.perf_counter() - self._login_done)
+            self._login_done = None
+        # Ensure roles exist on all guilds where the bot is present; guilds are prepared concurrently
+        guilds = []
         for guild in self.guilds:
             # Restrict to allowed guild if configured
             if self.config.allowed_guild_id and str(guild.id) != str(self.config.allowed_guild_id):
                 self.logger.info(f"Skipping guild '{guild.name}' ({guild.id}) due to ALLOWED_GUILD_ID restriction")
                 continue
+            guilds.append(guild)
+        with PROFILE.phase("on_ready (all guilds)"):
+            await asyncio.gather(*(self.prepare_guild(g) for g in guilds))
+        self.logger.info("Guardian is ready.")
+        PROFILE.report()
+        for line in self.memory_report():
+            self.logger.info(line)
+
+    async def prepare_guild(self, guild: discord.Guild):
+        with PROFILE.phase(f"on_ready guild {guild.id}"):
             await self.ensure_roles(guild)
             # Apply special user startup hearts and roles
             await self.apply_specials_in_guild(guild)
@@ -59,7 +220,6 @@ class GuardianClient(discord.Client):
                 await self.tree.sync(guild=guild)
             except Exception as e:
                 self.logger.warning(f"Slash command sync failed for {guild.name}: {e}")
-        self.logger.info("Guardian is ready.")
 
     def is_special(self, member: discord.Member) -> bool:
         if str(member.id) in self._special_ids:
@@ -76,6 +236,9 @@ class GuardianClient(discord.Client):
         specials = cfg.special_users or []
         if not specials:
             return
+        # Role rules need a member listing; gather it once, and only if such a rule applies here
+        role_ids = [str(su.get("roleId")).strip() for su in specials if not su.get("id") and su.get("roleId")]
+        role_members = await self.members_with_roles(guild, role_ids) if role_ids else {}
         # Build per-rule application: either user id or roleId
         for su in specials:
             uid = str(su.get("id") or "").strip()
@@ -83,16 +246,14 @@ class GuardianClient(discord.Client):
             targets: list[discord.Member] = []
             if uid:
                 try:
-                    member = guild.get_member(int(uid)) or await guild.fetch_member(int(uid))
+                    member = await self.members.get(guild, int(uid))
                     if member:
                         targets.append(member)
                 except Exception:
                     pass
             elif rid:
                 # Collect all members with role rid
-                role_obj = guild.get_role(int(rid))
-                if role_obj:
-                    targets = list(role_obj.members)
+                targets = role_members.get(rid, [])
             # Apply settings for targets
             for member in targets:
                 key = f"{guild.id}:{member.id}"
@@ -121,6 +282,26 @@ class GuardianClient(discord.Client):
                         except Exception:
                             pass
 
+    async def members_with_roles(self, guild: discord.Guild, role_ids: list[str]) -> dict[str, list[discord.Member]]:
+        roles = {rid: guild.get_role(int(rid)) for rid in role_ids if rid.isdigit()}
+        roles = {rid: r for rid, r in roles.items() if r is not None}
+        if not roles:
+            return {}
+        if not self.config.low_memory_mode:
+            return {rid: list(r.members) for rid, r in roles.items()}
+        # No member cache: stream the member list once, keeping only holders of the wanted roles
+        wanted = {r.id: rid for rid, r in roles.items()}
+        out: dict[str, list[discord.Member]] = {rid: [] for rid in roles}
+        try:
+            async for member in guild.fetch_members(limit=None):
+                for role in member.roles:
+                    rid = wanted.get(role.id)
+                    if rid is not None:
+                        out[rid].append(member)
+        except Exception as e:
+            self.logger.warning(f"Failed to list members of special roles in '{guild.name}': {e}")
+        return out
+
     async def assign_configured_roles(self, member: discord.Member, roles: list):
         guild = member.guild
         # roles can be IDs or names
@@ -140,15 +321,23 @@ class GuardianClient(discord.Client):
             self.logger.debug(f"Failed to assign special roles to {member.display_name}: {e}")
 
     async def ensure_roles(self, guild: discord.Guild):
-        needed = set(ordered_roles())
+        lock = self._role_locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            await self._ensure_roles_locked(guild)
+
+    async def _ensure_roles_locked(self, guild: discord.Guild):
         existing = {r.name: r for r in guild.roles}
+        # Once the gateway has delivered a created role, a later deletion may re-create it
+        self._created_roles -= {(guild.id, name) for name in existing}
         for name in ordered_roles():
-            if name not in existing:
+            # guild.roles only learns of a new role from the gateway event, so remember what we created
+            if name not in existing and (guild.id, name) not in self._created_roles:
                 try:
                     # Create role using color from roles.json if available
                     color_hex = role_color(name)
                     colour = discord.Color(value=color_hex) if isinstance(color_hex, int) else discord.Color.purple()
                     await guild.create_role(name=name, colour=colour, reason="Guardian auto-setup")
+                    self._created_roles.add((guild.id, name))
                     self.logger.info(f"Created role '{name}' in guild '{guild.name}'")
                 except discord.Forbidden:
                     self.logger.warning(f"Missing permissions to create role '{name}' in '{guild.name}'")
@@ -288,6 +477,189 @@ class GuardianClient(discord.Client):
             self.logger.error(f"Error kicking {member.display_name}: {e}")
         return False
 
+    async def apply_flag(
+        self,
+        message: discord.Message,
+        reasons: list,
+        edited: bool = False,
+        fragments: list[discord.Message] | None = None,
+        content: str | None = None,
+    ) -> int:
+        # Deduct hearts and record flag; store only flagged message content.
+        # For a coalesced unit, message is its last fragment and the flag covers all of them.
+        cfg = self.config
+        user_key = f"{message.guild.id}:{message.author.id}"
+        fragments = fragments or [message]
+        flag = {
+            "guild_id": str(message.guild.id),
+            "channel_id": str(message.channel.id),
+            "message_id": str(fragments[0].id),
+            "author_id": str(message.author.id),
+            "content": content if content is not None else "\n".join(m.content for m in fragments),
+            "reasons": reasons,
+        }
+        if len(fragments) > 1:
+            flag["message_ids"] = [str(m.id) for m in fragments]
+        if edited:
+            flag["edited"] = True
+        else:
+            # Repeats of flagged text must not be collapsed as harmless duplicates
+            for fragment in fragments:
+                self.flood.mark_flagged(message.guild.id, message.author.id, fragment.content)
+        self.store.record_flag(user_key, flag)
+        self.store.increment_flag(user_key)
+        hearts_now = self.store.add_hearts(user_key, -cfg.heart_penalty_flag)
+        what = "edited message" if edited else "message"
+        try:
+            await message.reply(
+                f"⚠️ Your {what} was flagged for: {', '.join(reasons) or 'policy violations'}. "
+                f"{cfg.heart_penalty_flag}❤️ deducted. Current: {hearts_now}❤️. Please keep it polite.",
+                mention_author=True,
+            )
+        except Exception:
+            pass
+        return hearts_now
+
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # Raw events fire for every edit, not only for messages still in discord.py's message cache
+        if payload.guild_id is None:
+            return
+        data = payload.data
+        if "content" not in data:
+            return  # embed unfurls and other updates that do not touch the text
+        if (data.get("author") or {}).get("bot"):
+            return
+        if self.config.allowed_guild_id and str(payload.guild_id) != str(self.config.allowed_guild_id):
+            return
+        if not self.owns_guild(payload.guild_id):
+            return
+        before = payload.cached_message.content if payload.cached_message is not None else None
+        if not self.edits.needs_analysis(payload.message_id, data["content"], before=before):
+            return
+        self.edits.debounce(payload.message_id, lambda: self.fetch_and_moderate_edit(payload.channel_id, payload.message_id))
+
+    async def fetch_and_moderate_edit(self, channel_id: int, message_id: int):
+        # Fetched only once an analysis is due, so the latest text is what gets checked
+        try:
+            channel = self.get_channel(channel_id) or await self.fetch_channel(channel_id)
+            message = await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            return
+        except Exception as e:
+            self.logger.error(f"Failed to fetch edited message {message_id}: {e}")
+            return
+        if message.guild is None or message.author.bot:
+            return
+        if not isinstance(message.author, discord.Member):
+            # Fetched messages carry a plain user when the member is not cached (e.g. low-memory mode)
+            member = await self.members.get(message.guild, message.author.id)
+            if member is None:
+                return
+            message.author = member
+        await self.moderate_edit(message)
+
+    async def moderate_edit(self, message: discord.Message):
+        # Re-check against the baseline: an earlier debounced run may already cover this content
+        if not self.edits.needs_analysis(message.id, message.content):
+            return
+        previous = self.edits.baseline(message.id)
+        unit = self.edits.unit(message.id)
+        # A fragment of a clean unit is judged with its siblings; after a flagged unit, on its own
+        text = unit.text_with(message.id, message.content) if unit is not None and not unit.flagged else message.content
+        analysis = await asyncio.to_thread(self.router.analyze, text, VARIANT_MODERATION)
+        flagged = analysis.get("flagged", False)
+        already_flagged = bool(previous and previous.flagged)
+        self.edits.remember(message.id, message.content, flagged or already_flagged)
+        if unit is not None:
+            unit.update(message.id, message.content)
+            unit.flagged = unit.flagged or flagged
+        # Edits never earn rewards, and a message is penalized at most once
+        if not flagged or already_flagged or str(message.author.id) in self._special_ids:
+            return
+        hearts_now = await self.apply_flag(message, analysis.get("reasons", []), edited=True, content=text)
+        user_key = f"{message.guild.id}:{message.author.id}"
+        role_name = await self.assign_role_for_hearts(message.author, hearts_now)
+        if role_name:
+            self.store.update_user(user_key, {"role": role_name})
+        if hearts_now <= 0:
+            await self.maybe_kick(message.author, reason="Guardian: 0 hearts")
+
+    async def on_flood(self, message: discord.Message):
+        cfg = self.config
+        offence = self.flood.offences.get((message.guild.id, message.author.id))
+        if offence is None:
+            return
+        if offence.dropped == 1:
+            # First dropped message of this flood: settle it once the user goes quiet
+            self.loop.create_task(self._settle_flood(message))
+        if (
+            cfg.flood_timeout_seconds > 0
+            and not offence.timed_out
+            and offence.dropped >= cfg.flood_timeout_after
+            and isinstance(message.author, discord.Member)
+            and not self.is_special(message.author)
+        ):
+            offence.timed_out = True
+            try:
+                await message.author.timeout(timedelta(seconds=cfg.flood_timeout_seconds), reason="Guardian: message flood")
+                self.logger.info(f"Timed out {message.author.display_name} for flooding")
+            except discord.Forbidden:
+                self.logger.warning(f"Insufficient permissions to time out {message.author.display_name}")
+            except Exception as e:
+                self.logger.error(f"Error timing out {message.author.display_name}: {e}")
+
+    async def _settle_flood(self, message: discord.Message):
+        # One analysis, one flag, one transaction and one notice for the whole flood
+        cfg = self.config
+        while True:
+            await asyncio.sleep(self.flood.user_window)
+            offence = self.flood.settle(message.guild.id, message.author.id)
+            if offence is not None:
+                break
+        member = message.author
+        if str(member.id) in self._special_ids:
+            return
+        # Dropped messages skipped analysis on arrival; check their text together now
+        text = "\n".join(offence.contents)
+        analysis = await asyncio.to_thread(self.router.analyze, text, VARIANT_MODERATION) if text.strip() else {}
+        content_flagged = analysis.get("flagged", False)
+        # A short burst over the limit is ignored; only a sustained flood is penalized
+        rate_penalty = cfg.flood_penalty if offence.dropped >= cfg.flood_penalty_after else 0
+        if not content_flagged and rate_penalty <= 0:
+            return
+        reasons = (["flood"] if rate_penalty > 0 else []) + (list(analysis.get("reasons", [])) if content_flagged else [])
+        penalty = rate_penalty + (cfg.heart_penalty_flag if content_flagged else 0)
+        user_key = f"{message.guild.id}:{member.id}"
+        self.store.get_or_create_user(user_key, str(member), cfg.heart_start, guild_id=str(message.guild.id))
+        self.store.record_flag(user_key, {
+            "guild_id": str(message.guild.id),
+            "channel_id": str(offence.channel_id),
+            "message_id": str(offence.message_ids[0]) if offence.message_ids else None,
+            "message_ids": [str(i) for i in offence.message_ids],
+            "author_id": str(member.id),
+            "content": text,
+            "reasons": reasons,
+            "dropped": offence.dropped,
+        })
+        self.store.increment_flag(user_key)
+        hearts_now = self.store.add_hearts(user_key, -penalty)
+        why = f"sent {offence.dropped} message(s) too fast"
+        if content_flagged:
+            flagged_for = ", ".join(r for r in reasons if r != "flood") or "policy violations"
+            why += f"; they were flagged for: {flagged_for}"
+        try:
+            await message.channel.send(
+                f"⚠️ {member.mention} {why}. {penalty}❤️ deducted. Current: {hearts_now}❤️. Please slow down."
+            )
+        except Exception:
+            pass
+        if isinstance(member, discord.Member):
+            role_name = await self.assign_role_for_hearts(member, hearts_now)
+            if role_name:
+                self.store.update_user(user_key, {"role": role_name})
+            if hearts_now <= 0:
+                await self.maybe_kick(member, reason="Guardian: 0 hearts")
+
     async def on_message(self, message: discord.Message):
         # Ignore ourselves and other bots
         if message.author.bot:
@@ -296,23 +668,118 @@ class GuardianClient(discord.Client):
             return  # only moderate servers
         if self.config.allowed_guild_id and str(message.guild.id) != str(self.config.allowed_guild_id):
             return
+        if not self.owns_guild(message.guild.id):
+            return
+        # Throttle floods in memory before any Firestore or Gemini call
+        dropped = self.flood.check(message.guild.id, message.channel.id, message.author.id, message.id, message.content)
+        if dropped:
+            if dropped == DROP_USER_RATE:
+                await self.on_flood(message)
+            return
+        if self.coalescer is not None:
+            self.coalescer.add(message)
+            return
+        await self.handle_unit([message])
+
+    async def handle_unit(self, messages: list[discord.Message]):
+        started = time.perf_counter()
+        try:
+            await self.handle_message(messages[-1], fragments=messages)
+        except Exception:
+            self.health.record(time.perf_counter() - started, error=True, messages=len(messages))
+            raise
+        self.health.record(time.perf_counter() - started, messages=len(messages))
+
+    async def run_analysis(self, text: str, variant: str, on_flagged=None) -> dict:
+        """Analyze text off the event loop so routes can serve messages concurrently.
+
+        With GEMINI_STREAMING on, on_flagged(reasons) is awaited as soon as a
+        flagged verdict and its reasons have streamed in, while the reward
+        fields are still being generated.
+        """
+        if not self.config.gemini_streaming or on_flagged is None:
+            return await asyncio.to_thread(self.router.analyze, text, variant)
+        loop = asyncio.get_running_loop()
+        early: asyncio.Future = loop.create_future()
+        fields: dict = {}
+
+        def collect(name, value):
+            fields.setdefault(name, value)
+            if early.done() or "flagged" not in fields:
+                return
+            if not fields["flagged"]:
+                early.set_result(None)
+            elif "reasons" in fields:
+                early.set_result(list(fields["reasons"] or []))
+
+        def on_field(name, value):
+            # Called from the worker thread
+            loop.call_soon_threadsafe(collect, name, value)
+
+        task = asyncio.ensure_future(asyncio.to_thread(self.router.analyze, text, variant, on_field))
+        await asyncio.wait({early, task}, return_when=asyncio.FIRST_COMPLETED)
+        if early.done() and early.result() is not None:
+            await on_flagged(early.result())
+        return await task
+
+    def resolve_helper(self, message: discord.Message) -> discord.Member | discord.User | None:
+        helper_member = None
+        if message.reference and message.reference.resolved and isinstance(message.reference.resolved, discord.Message):
+            # Reward the author of the message being replied to
+            replied_msg: discord.Message = message.reference.resolved
+            if replied_msg.author and not replied_msg.author.bot:
+                helper_member = replied_msg.author
+        if not helper_member:
+            # Fallback: first mentioned member
+            if message.mentions:
+                cand = next((m for m in message.mentions if (not m.bot) and (m.id != message.author.id)), None)
+                if cand:
+                    helper_member = cand
+        # Do not allow self-rewarding by replying to self or self-mentioning
+        if helper_member and helper_member.id == message.author.id:
+            helper_member = None
+        return helper_member
 
+    async def handle_message(self, message: discord.Message, fragments: list[discord.Message] | None = None):
+        # message is the last fragment of the unit: replies and reactions go there
         cfg = self.config
+        fragments = fragments or [message]
+        text = "\n".join(m.content for m in fragments)
         store = self.store
+        if cfg.low_memory_mode and isinstance(message.author, discord.Member):
+            # Keep members who chat close at hand
+            self.members.put(message.author)
 
         # Build a per-guild user key
         user_key = f"{message.guild.id}:{message.author.id}"
         profile = store.get_or_create_user(user_key, str(message.author), cfg.heart_start, guild_id=str(message.guild.id))
 
+        # problem_solved/praise only reward a helper, so ask for them only when there is one
+        helper_member = next((h for h in map(self.resolve_helper, fragments) if h is not None), None)
+        variant = VARIANT_REWARD if helper_member else VARIANT_MODERATION
+
+        # Special users: do not penalize or record flags; only allow positive increases as usual
+        is_special = str(message.author.id) in self._special_ids
+
+        flag_hearts: list[int] = []
+
+        async def flag_early(early_reasons: list):
+            flag_hearts.append(await self.apply_flag(message, early_reasons, fragments=fragments))
+
+        # Analyze content with Gemini; the task starts at the next await, so the
+        # blocking bonus transaction below runs in a thread to overlap with it
+        analysis_task = asyncio.ensure_future(
+            self.run_analysis(text, variant, on_flagged=None if is_special else flag_early)
+        )
+
         # Apply daily bonus if due (once per day per user per guild)
-        new_hearts_after_bonus = store.apply_daily_bonus_if_due(user_key, cfg.heart_daily_bonus)
+        new_hearts_after_bonus = await asyncio.to_thread(store.apply_daily_bonus_if_due, user_key, cfg.heart_daily_bonus)
         if new_hearts_after_bonus is not None:
             role_name = await self.assign_role_for_hearts(message.author, new_hearts_after_bonus)
             if role_name:
                 store.update_user(user_key, {"role": role_name})
 
-    # Analyze content with Gemini
-        analysis = analyze_message(cfg.gemini_api_key, message.content)
+        analysis = await analysis_task
         flagged = analysis.get("flagged", False)
         reasons = analysis.get("reasons", [])
         good_advice = analysis.get("good_advice", False)
@@ -321,29 +788,23 @@ class GuardianClient(discord.Client):
 
         hearts_now: Optional[int] = None
 
-        # Special users: do not penalize or record flags; only allow positive increases as usual
-        is_special = str(message.author.id) in self._special_ids
+        if flag_hearts and not flagged:
+            # Truncated stream or a failover route disagreeing; the penalty already stands
+            self.logger.warning(
+                f"Streamed verdict flagged message {message.id} but the final verdict did not; keeping the penalty"
+            )
 
-        if flagged and not is_special:
-            # Deduct hearts and record flag; store only flagged message content
-            store.record_flag(user_key, {
-                "guild_id": str(message.guild.id),
-                "channel_id": str(message.channel.id),
-                "message_id": str(message.id),
-                "author_id": str(message.author.id),
-                "content": message.content,
-                "reasons": reasons,
-            })
-            store.increment_flag(user_key)
-            hearts_now = store.add_hearts(user_key, -cfg.heart_penalty_flag)
-            try:
-                await message.reply(
-                    f"⚠️ Your message was flagged for: {', '.join(reasons) or 'policy violations'}. "
-                    f"{cfg.heart_penalty_flag}❤️ deducted. Current: {hearts_now}❤️. Please keep it polite.",
-                    mention_author=True,
-                )
-            except Exception:
-                pass
+        # Baseline for later edit moderation; a penalized message counts as flagged
+        if len(fragments) > 1:
+            self.edits.remember_unit([(f.id, f.content) for f in fragments], flagged or bool(flag_hearts))
+        else:
+            self.edits.remember(message.id, message.content, flagged or bool(flag_hearts))
+
+        if flag_hearts:
+            # Already penalized from the streamed verdict
+            hearts_now = flag_hearts[0]
+        elif flagged and not is_special:
+            hearts_now = await self.apply_flag(message, reasons, fragments=fragments)
 
         # Positive signals
         # Rule:
@@ -353,22 +814,6 @@ class GuardianClient(discord.Client):
         if good_advice:
             delta_author += cfg.heart_advice
 
-        helper_member = None
-        if message.reference and message.reference.resolved and isinstance(message.reference.resolved, discord.Message):
-            # Reward the author of the message being replied to
-            replied_msg: discord.Message = message.reference.resolved
-            if replied_msg.author and not replied_msg.author.bot:
-                helper_member = replied_msg.author
-        if not helper_member:
-            # Fallback: first mentioned member
-            if message.mentions:
-                cand = next((m for m in message.mentions if (not m.bot) and (m.id != message.author.id)), None)
-                if cand:
-                    helper_member = cand
-        # Do not allow self-rewarding by replying to self or self-mentioning
-        if helper_member and helper_member.id == message.author.id:
-            helper_member = None
-
         delta_helper = 0
         if problem_solved:
             delta_helper += cfg.heart_problem_solved
@@ -443,18 +888,23 @@ class GuardianClient(discord.Client):
             await self.maybe_kick(message.author, reason="Guardian: 0 hearts")
 
 
-def main():
-    cfg = get_config()
-    setup_logging(cfg.log_level)
+def build_intents() -> discord.Intents:
     intents = discord.Intents.default()
     intents.message_content = True
     intents.members = True
     intents.guilds = True
+    return intents
 
-    collection = os.getenv("FIRESTORE_COLLECTION", "discord-guardian")
-    store = Store(collection)
 
-    client = GuardianClient(intents=intents, store=store, config=cfg)
+def build_client(cfg, store: Store, **client_kwargs) -> GuardianClient:
+    if cfg.low_memory_mode:
+        # No member cache or startup chunking; members are fetched on demand into a small LRU.
+        # The message cache only has to hold messages for edit moderation: reply targets
+        # arrive resolved in the message payload.
+        client_kwargs.setdefault("member_cache_flags", discord.MemberCacheFlags.none())
+        client_kwargs.setdefault("chunk_guilds_at_startup", False)
+        client_kwargs.setdefault("max_messages", cfg.low_memory_max_messages)
+    client = GuardianClient(intents=build_intents(), store=store, config=cfg, **client_kwargs)
     # Register slash commands
 
     @client.tree.command(name="hearts", description="Show your current hearts")
@@ -545,6 +995,149 @@ def main():
         if hearts_now <= 0:
             await client.maybe_kick(member, reason="Guardian penalize to 0 hearts")
         await interaction.followup.send(f"Deducted {amount}❤️ from {member.mention}. Now {hearts_now}❤️.")
+
+    @client.tree.command(name="guardian-gemini", description="Gemini route latency and error stats (admin only)")
+    async def gemini_stats_cmd(interaction: discord.Interaction):
+        if not client.is_admin(interaction.user):
+            return await interaction.response.send_message("You need Manage Server permission.", ephemeral=True)
+        lines = []
+        for row in client.router.stats():
+            status = "ejected" if row["ejected"] else "ok"
+            lines.append(
+                f"`{row['route']}` [{row['tier']}, w={row['weight']}, {status}] — "
+                f"{row['requests']} req, {row['errors']} err ({row['error_rate']:.0%}), "
+                f"avg {row['avg_latency_ms']}ms, max {row['max_latency_ms']}ms, key {row['key_rpm_used']}/min"
+            )
+        lines.append("Token usage by prompt variant:")
+        for row in client.router.token_stats():
+            lines.append(
+                f"`{row['variant']}` — {row['calls']} calls, in {row['input_tokens']} "
+                f"(avg {row['avg_input_tokens']}), out {row['output_tokens']} (avg {row['avg_output_tokens']})"
+            )
+        await interaction.response.send_message(("Gemini routes:\n" + "\n".join(lines))[:1900], ephemeral=True)
+
+    @client.tree.command(name="guardian-export-flags", description="Export this server's flag history (admin only)")
+    @app_commands.describe(
+        format="File format",
+        since="Start date/time, e.g. 2025-01-31 (UTC)",
+        until="End date/time, inclusive for dates (UTC)",
+        reason="Only flags with this reason, e.g. profanity",
+    )
+    @app_commands.choices(format=[app_commands.Choice(name=f, value=f) for f in EXPORT_FORMATS])
+    async def export_flags_cmd(
+        interaction: discord.Interaction,
+        format: str = "ndjson",
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        reason: Optional[str] = None,
+    ):
+        if not client.is_admin(interaction.user):
+            return await interaction.response.send_message("You need Manage Server permission.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        if interaction.guild is None:
+            return await interaction.followup.send("This command only works in servers.", ephemeral=True)
+        if cfg.allowed_guild_id and str(interaction.guild.id) != str(cfg.allowed_guild_id):
+            return await interaction.followup.send("This bot is restricted to a specific server.", ephemeral=True)
+        try:
+            since_ts = parse_time_bound(since)
+            until_ts = parse_time_bound(until, end=True)
+        except ValueError:
+            return await interaction.followup.send("Dates must look like 2025-01-31 or 2025-01-31T12:00.", ephemeral=True)
+        guild_id = str(interaction.guild.id)
+        try:
+            # Firestore paging and compression are blocking; keep them off the event loop
+            path, count = await asyncio.to_thread(
+                export_flags_to_file, store, guild_id, format, since_ts, until_ts, reason or None
+            )
+        except Exception as e:
+            client.logger.error(f"Flag export failed for guild {guild_id}: {e}")
+            return await interaction.followup.send("Export failed; check the bot logs (a Firestore index may be missing).", ephemeral=True)
+        try:
+            size = os.path.getsize(path)
+            if size > interaction.guild.filesize_limit:
+                return await interaction.followup.send(
+                    f"{count} flag(s) matched, but the compressed export ({size / 2**20:.1f} MiB) exceeds "
+                    f"this server's upload limit. Narrow the time range or filter by reason.",
+                    ephemeral=True,
+                )
+            filename = f"flags-{guild_id}.{format}.gz"
+            await interaction.followup.send(
+                f"Exported {count} flag(s).", file=discord.File(path, filename=filename), ephemeral=True
+            )
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    @client.tree.command(name="guardian-analytics", description="Hearts distribution and role what-ifs (admin only)")
+    @app_commands.describe(
+        roles="A proposed roles.json to simulate promotions and demotions against",
+        refresh="Rescan Firestore instead of reusing a recent scan",
+    )
+    async def analytics_cmd(interaction: discord.Interaction, roles: Optional[discord.Attachment] = None, refresh: bool = False):
+        if not client.is_admin(interaction.user):
+            return await interaction.response.send_message("You need Manage Server permission.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        if interaction.guild is None:
+            return await interaction.followup.send("This command only works in servers.", ephemeral=True)
+        if cfg.allowed_guild_id and str(interaction.guild.id) != str(cfg.allowed_guild_id):
+            return await interaction.followup.send("This bot is restricted to a specific server.", ephemeral=True)
+        from .analytics import format_report, summarize
+
+        proposed = None
+        if roles is not None:
+            try:
+                proposed = parse_roles(json.loads(await roles.read()))
+            except (ValueError, TypeError) as e:
+                return await interaction.followup.send(f"Could not read the roles file: {e}", ephemeral=True)
+        guild_id = str(interaction.guild.id)
+        try:
+            # The Firestore scan is blocking; the sample is cached for ANALYTICS_CACHE_TTL seconds
+            sample = await asyncio.to_thread(client.analytics.sample, guild_id, refresh)
+        except Exception as e:
+            client.logger.error(f"Hearts analytics scan failed for guild {guild_id}: {e}")
+            return await interaction.followup.send("Analytics failed; check the bot logs.", ephemeral=True)
+        report = summarize(sample, cfg.heart_penalty_flag, proposed=proposed)
+        age = int(time.time() - sample.scanned_at)
+        footer = f"\nScanned {age}s ago in {sample.scan_seconds:.1f}s."
+        await interaction.followup.send(format_report(report)[: 1990 - len(footer)] + footer, ephemeral=True)
+    return client
+
+
+def start_warmup(store: Store) -> None:
+    """Create the Firestore client and import requests in the background, while the gateway logs in."""
+    def warm():
+        store.warm()
+        with PROFILE.phase("requests import"):
+            import requests  # noqa: F401
+
+    threading.Thread(target=warm, name="guardian-warmup", daemon=True).start()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="discord-guardian")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="log time spent in imports, config, Firestore client, login and on_ready per guild",
+    )
+    args = parser.parse_args(argv)
+    with PROFILE.phase("config"):
+        cfg = get_config()
+    cfg.profile_startup = cfg.profile_startup or args.profile_startup
+    PROFILE.enabled = cfg.profile_startup
+    setup_logging(cfg.log_level)
+    if cfg.shard_count > 1:
+        # Sharded mode: a supervisor runs one worker process per shard
+        run_supervisor(cfg)
+        return
+
+    collection = os.getenv("FIRESTORE_COLLECTION", "discord-guardian")
+    store = Store(collection)
+    start_warmup(store)
+
+    client = build_client(cfg, store)
     client.run(cfg.discord_token)
 
 
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+import discord
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None if unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Peak rather than current RSS; ru_maxrss is bytes on macOS and KiB elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return None
+
+
+class MemberLRU:
+    """Small LRU of members for low-memory mode, where discord.py keeps no member cache.
+
+    Members are added as they chat and fetched over HTTP on a miss, so only
+    active members are held in memory.
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 900.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Tuple[int, int], Tuple[float, discord.Member]]" = OrderedDict()
+        self.hits = 0
+        self.fetches = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def put(self, member: discord.Member) -> None:
+        key = (member.guild.id, member.id)
+        self._data[key] = (time.monotonic(), member)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def cached(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        item = self._data.get((guild.id, user_id))
+        if item is None or time.monotonic() - item[0] > self.ttl_seconds:
+            return None
+        self._data.move_to_end((guild.id, user_id))
+        self.hits += 1
+        return item[1]
+
+    def counts_by_guild(self) -> Dict[int, int]:
+        return Counter(gid for gid, _ in self._data)
+
+    async def get(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        member = self.cached(guild, user_id)
+        if member is not None:
+            return member
+        try:
+            member = await guild.fetch_member(user_id)
+        except (discord.NotFound, discord.Forbidden):
+            return None
+        self.fetches += 1
+        self.put(member)
+        return member
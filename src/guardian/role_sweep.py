@@ -0,0 +1,167 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .roles import ordered_roles, role_for_hearts
+
+if TYPE_CHECKING:
+    from .main import GuardianClient
+
+logger = logging.getLogger(__name__)
+
+
+def plan_level_roles(current: Iterable[str], hearts: int, known: Iterable[str]) -> Tuple[str, List[str], bool]:
+    """Return (target role, level roles to remove, whether target must be added)."""
+    target = role_for_hearts(hearts)
+    known_set = set(known)
+    current_levels = [name for name in current if name in known_set]
+    remove = [name for name in current_levels if name != target]
+    return target, remove, target not in current_levels
+
+
+@dataclass
+class RoleChange:
+    member: discord.Member
+    user_key: str
+    target: str
+    add: Optional[discord.Role]
+    remove: List[discord.Role] = field(default_factory=list)
+
+    @property
+    def operations(self) -> int:
+        return len(self.remove) + (1 if self.add else 0)
+
+
+class RateLimiter:
+    """Token bucket shared by the sweep workers."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1) -> None:
+        if self.interval <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval * tokens
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RoleSweeper:
+    """Periodically reconcile level roles with stored hearts for every guild.
+
+    Hearts are streamed from Firestore page by page and compared with the
+    roles of cached members (members outside the cache are left for the
+    message path). Only members whose level role drifted produce work, which a
+    small pool of workers applies under a shared rate limit. No DMs are sent.
+    """
+
+    def __init__(self, client: "GuardianClient", *, interval: float, page_size: int = 500, workers: int = 4, ops_per_second: float = 2.0):
+        self.client = client
+        self.interval = interval
+        self.page_size = page_size
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(ops_per_second)
+
+    async def run_forever(self) -> None:
+        await self.client.wait_until_ready()
+        # Skip the startup pass: on_ready already sets up roles, and restarts should not rescan every guild
+        await asyncio.sleep(self.interval)
+        while not self.client.is_closed():
+            for guild in list(self.client.guilds):
+                cfg = self.client.config
+                if cfg.allowed_guild_id and str(guild.id) != str(cfg.allowed_guild_id):
+                    continue
+                if not self.client.owns_guild(guild.id):
+                    continue
+                try:
+                    await self.sweep_guild(guild)
+                except Exception as e:
+                    logger.error(f"Role sweep failed for guild '{guild.name}': {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep_guild(self, guild: discord.Guild) -> Dict[str, int]:
+        started = time.perf_counter()
+        stats = {"scanned": 0, "uncached": 0, "missing_role": 0, "drifted": 0, "operations": 0, "failed": 0}
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 4)
+        workers = [asyncio.create_task(self._worker(queue, stats)) for _ in range(self.workers)]
+        try:
+            # The sweep may start alongside on_ready; create renamed or new level roles first
+            await self.client.ensure_roles(guild)
+            known = ordered_roles()
+            by_name = {r.name: r for r in guild.roles}
+            pages = self.client.store.iter_guild_hearts(str(guild.id), page_size=self.page_size)
+            while True:
+                # Firestore paging is blocking; fetch each page off the event loop
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    break
+                for user_key, hearts in page:
+                    stats["scanned"] += 1
+                    change = self._plan(guild, user_key, hearts, known, by_name)
+                    if change is None:
+                        continue
+                    if change is False:
+                        stats["uncached"] += 1
+                        continue
+                    if change is True:
+                        stats["missing_role"] += 1
+                        continue
+                    stats["drifted"] += 1
+                    await queue.put(change)
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+        logger.info(
+            f"Role sweep '{guild.name}': scanned {stats['scanned']}, drifted {stats['drifted']}, "
+            f"{stats['operations']} role op(s), {stats['failed']} failed, {stats['uncached']} uncached, "
+            f"{stats['missing_role']} skipped for a missing role "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return stats
+
+    def _plan(self, guild: discord.Guild, user_key: str, hearts: int, known: List[str], by_name: Dict[str, discord.Role]):
+        # None: nothing to do; False: member not cached, so it cannot be compared;
+        # True: the target role does not exist in the guild, so the member is left untouched
+        _, _, uid = user_key.partition(":")
+        if not uid.isdigit():
+            return None
+        member = self.client.members.cached(guild, int(uid))
+        if member is None:
+            return False
+        target, remove_names, add_needed = plan_level_roles((r.name for r in member.roles), hearts, known)
+        if target not in by_name:
+            # Never strip the current level role without a replacement to give
+            return True
+        add = by_name[target] if add_needed else None
+        remove = [r for r in member.roles if r.name in remove_names]
+        if add is None and not remove:
+            return None
+        return RoleChange(member=member, user_key=user_key, target=target, add=add, remove=remove)
+
+    async def _worker(self, queue: asyncio.Queue, stats: Dict[str, int]) -> None:
+        while True:
+            change: RoleChange = await queue.get()
+            try:
+                await self.limiter.acquire(change.operations)
+                if change.remove:
+                    await change.member.remove_roles(*change.remove, reason="Guardian role sweep")
+                if change.add is not None:
+                    await change.member.add_roles(change.add, reason="Guardian role sweep")
+                stats["operations"] += change.operations
+                self.client.store.update_user(change.user_key, {"role": change.target})
+            except Exception as e:
+                stats["failed"] += 1
+                logger.debug(f"Role sweep could not update {change.member.display_name}: {e}")
+            finally:
+                queue.task_done()
@@ -7,18 +7,35 @@ _ROLES_SPEC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
 _ROLES_CACHE: List[Dict] | None = None
 
 
+def load_roles_file(path: str) -> List[Dict]:
+    """Read a roles.json-style file, sorted by minHearts descending. Raises on a missing or invalid file."""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_roles(json.load(f))
+
+
+def parse_roles(data: Dict) -> List[Dict]:
+    """Validate a parsed roles.json document and sort it by minHearts descending."""
+    roles = data.get("roles", []) if isinstance(data, dict) else []
+    if not isinstance(roles, list) or not roles:
+        raise ValueError("No roles defined")
+    for i, spec in enumerate(roles, start=1):
+        if not isinstance(spec, dict) or not isinstance(spec.get("name"), str) or not spec["name"]:
+            raise ValueError(f"Role #{i} needs a non-empty \"name\"")
+        try:
+            int(spec.get("minHearts", 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"Role '{spec['name']}' has a non-integer minHearts") from None
+    # Sort by minHearts descending so we can pick the first match
+    return sorted(roles, key=lambda r: int(r.get("minHearts", 0)), reverse=True)
+
+
 def _load_roles() -> List[Dict]:
     global _ROLES_CACHE
     if _ROLES_CACHE is not None:
         return _ROLES_CACHE
     try:
-        with open(_ROLES_SPEC_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            roles = data.get("roles", [])
-            # Sort by minHearts descending so we can pick the first match
-            roles_sorted = sorted(roles, key=lambda r: int(r.get("minHearts", 0)), reverse=True)
-            _ROLES_CACHE = roles_sorted
-            return roles_sorted
+        _ROLES_CACHE = load_roles_file(_ROLES_SPEC_PATH)
+        return _ROLES_CACHE
     except Exception:
         # Fallback to defaults
         defaults = [
@@ -52,3 +69,8 @@ def role_color(name: str):
                 except Exception:
                     return None
     return None
+
+
+def role_specs() -> List[Dict]:
+    """The active role ladder (roles.json or the defaults), highest minHearts first."""
+    return list(_load_roles())
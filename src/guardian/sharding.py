@@ -0,0 +1,190 @@
+from __future__ import annotations
+import copy
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    # Discord's gateway sharding formula; every guild (and its users) belongs to exactly one shard
+    return (int(guild_id) >> 22) % int(shard_count)
+
+
+@dataclass
+class ShardHealth:
+    """Message throughput and latency counters for one shard (or the single client)."""
+
+    shard_id: Optional[int]
+    started_at: float = field(default_factory=time.monotonic)
+    messages: int = 0
+    errors: int = 0
+    total_handle_time: float = 0.0
+    _last_messages: int = 0
+    _last_snapshot: float = field(default_factory=time.monotonic)
+
+    def record(self, duration: float, error: bool = False, messages: int = 1) -> None:
+        self.messages += messages
+        self.total_handle_time += duration
+        if error:
+            self.errors += 1
+
+    def snapshot(self, *, guilds: int, gateway_latency: float, ready: bool, rss_bytes: Optional[int] = None) -> Dict[str, Any]:
+        now = time.monotonic()
+        elapsed = max(now - self._last_snapshot, 1e-6)
+        rate = (self.messages - self._last_messages) / elapsed
+        # discord.py reports NaN latency until the first gateway heartbeat
+        latency_ms = None if gateway_latency != gateway_latency else round(gateway_latency * 1000, 1)
+        self._last_messages = self.messages
+        self._last_snapshot = now
+        return {
+            "shard_id": self.shard_id,
+            "pid": os.getpid(),
+            "ready": ready,
+            "guilds": guilds,
+            "gateway_latency_ms": latency_ms,
+            "messages": self.messages,
+            "errors": self.errors,
+            "messages_per_sec": round(rate, 2),
+            "avg_handle_ms": round(self.total_handle_time / self.messages * 1000, 1) if self.messages else 0.0,
+            "rss_mb": round(rss_bytes / 2**20, 1) if rss_bytes is not None else None,
+            "uptime_s": int(now - self.started_at),
+            "ts": time.time(),
+        }
+
+
+def run_shard(cfg, shard_id: int, shard_count: int, health_queue) -> None:
+    """Worker process entry point: run a single gateway shard."""
+    # Imported here so the supervisor process never loads discord or Firestore
+    from .firestore_store import Store
+    from .main import build_client, setup_logging, start_warmup
+    from .startup import PROFILE
+
+    PROFILE.enabled = cfg.profile_startup
+    setup_logging(cfg.log_level)
+    store = Store(cfg.firestore_collection)
+    start_warmup(store)
+    client = build_client(cfg, store, shard_id=shard_id, shard_count=shard_count, health_queue=health_queue)
+    client.run(cfg.discord_token)
+
+
+@dataclass
+class _Worker:
+    shard_id: int
+    process: Optional[multiprocessing.process.BaseProcess] = None
+    restarts: int = 0
+    crash_streak: int = 0  # drives backoff; cleared once the shard has been healthy for a while
+    next_start: float = 0.0
+    last_health: Optional[Dict[str, Any]] = None
+    last_seen: float = 0.0
+    deadline: float = 0.0  # next health report due by this time, else the shard is treated as hung
+    healthy_since: float = 0.0
+
+
+def run_supervisor(cfg) -> None:
+    """Run and watch one worker process per shard assigned to this node.
+
+    SHARD_IDS lets several nodes split one SHARD_COUNT between them. Dead
+    workers are restarted with exponential backoff, and shard starts are
+    spaced by SHARD_START_DELAY to respect Discord's identify rate limit.
+    A worker that sends no report within SHARD_STARTUP_TIMEOUT of starting,
+    or stops reporting later, is terminated and restarted.
+    """
+    shard_count = int(cfg.shard_count)
+    shard_ids: List[int] = list(cfg.shard_ids or range(shard_count))
+    bad = [s for s in shard_ids if s < 0 or s >= shard_count]
+    if bad:
+        raise RuntimeError(f"SHARD_IDS {bad} out of range for SHARD_COUNT={shard_count}")
+    if cfg.gemini_key_rpm > 0:
+        # Every shard process has its own router, but the keys' quota is shared by all shards on all nodes
+        cfg = copy.copy(cfg)
+        cfg.gemini_key_rpm = max(1, cfg.gemini_key_rpm // shard_count)
+        logger.info(f"GEMINI_KEY_RPM split across {shard_count} shards: {cfg.gemini_key_rpm}/min per key per shard")
+    ctx = multiprocessing.get_context("spawn")
+    health_queue = ctx.Queue()
+    interval = max(1, int(cfg.shard_health_interval))
+    stale_after = interval * 4
+    startup_timeout = max(float(cfg.shard_startup_timeout), stale_after)
+    # A shard that stays healthy this long starts its backoff from scratch on the next crash
+    stable_after = max(300.0, interval * 10.0)
+    start_delay = max(0.0, float(cfg.shard_start_delay))
+
+    now = time.monotonic()
+    workers = {sid: _Worker(shard_id=sid, next_start=now + i * start_delay) for i, sid in enumerate(shard_ids)}
+    logger.info(f"Supervisor starting shards {shard_ids} of {shard_count}")
+    last_summary = now
+    try:
+        while True:
+            now = time.monotonic()
+            for w in workers.values():
+                if w.process is not None and not w.process.is_alive():
+                    backoff = min(300.0, start_delay * (2 ** w.crash_streak)) or 1.0
+                    logger.warning(f"Shard {w.shard_id} exited (code={w.process.exitcode}); restarting in {backoff:.0f}s")
+                    w.process = None
+                    w.restarts += 1
+                    w.crash_streak += 1
+                    w.healthy_since = 0.0
+                    w.next_start = now + backoff
+                elif w.process is not None and now > w.deadline:
+                    if w.last_seen:
+                        logger.warning(f"Shard {w.shard_id} missed health reports for {now - w.last_seen:.0f}s; terminating")
+                    else:
+                        logger.warning(f"Shard {w.shard_id} sent no health report within {startup_timeout:.0f}s of starting; terminating")
+                    w.process.terminate()
+                    # Not re-checked until the process has exited and been restarted
+                    w.deadline = float("inf")
+                elif w.crash_streak and w.healthy_since and now - w.healthy_since >= stable_after:
+                    logger.info(f"Shard {w.shard_id} stable for {now - w.healthy_since:.0f}s; resetting restart backoff")
+                    w.crash_streak = 0
+                if w.process is None and now >= w.next_start:
+                    w.process = ctx.Process(
+                        target=run_shard,
+                        args=(cfg, w.shard_id, shard_count, health_queue),
+                        name=f"guardian-shard-{w.shard_id}",
+                        daemon=False,
+                    )
+                    w.process.start()
+                    w.last_seen = 0.0
+                    w.deadline = now + startup_timeout
+                    logger.info(f"Started shard {w.shard_id} (pid={w.process.pid})")
+            # Drain health reports (block briefly for the first, then take whatever is queued)
+            try:
+                report = health_queue.get(timeout=1.0)
+                while True:
+                    w = workers.get(report.get("shard_id"))
+                    if w is not None and w.process is not None:
+                        w.last_health = report
+                        w.last_seen = time.monotonic()
+                        if w.deadline != float("inf"):
+                            w.deadline = w.last_seen + stale_after
+                        if report.get("ready") and not w.healthy_since:
+                            w.healthy_since = w.last_seen
+                    report = health_queue.get_nowait()
+            except queue.Empty:
+                pass
+            if time.monotonic() - last_summary >= interval:
+                last_summary = time.monotonic()
+                for w in workers.values():
+                    h = w.last_health
+                    if not h:
+                        logger.info(f"Shard {w.shard_id}: no report yet (restarts={w.restarts})")
+                        continue
+                    logger.info(
+                        f"Shard {w.shard_id}: pid={h['pid']} ready={h['ready']} guilds={h['guilds']} "
+                        f"latency={h['gateway_latency_ms']}ms msgs={h['messages']} ({h['messages_per_sec']}/s) "
+                        f"avg={h['avg_handle_ms']}ms errors={h['errors']} rss={h.get('rss_mb')}MiB restarts={w.restarts}"
+                    )
+    except KeyboardInterrupt:
+        logger.info("Supervisor shutting down")
+    finally:
+        for w in workers.values():
+            if w.process is not None and w.process.is_alive():
+                w.process.terminate()
+        for w in workers.values():
+            if w.process is not None:
+                w.process.join(timeout=10)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """Wall-clock timings of startup phases, reported once the bot is ready.
+
+    Phases may run concurrently (e.g. the Firestore client warms up in a
+    thread while the gateway logs in), so durations need not add up to the
+    total.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self) -> None:
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        total = time.perf_counter() - self.started
+        with self._lock:
+            phases = list(self.phases)
+        logger.info(f"Startup profile ({total * 1000:.0f} ms to ready):")
+        for name, seconds in phases:
+            logger.info(f"  {name:<40} {seconds * 1000:8.1f} ms")
+
+
+PROFILE = StartupProfile()
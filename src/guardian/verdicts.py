@@ -0,0 +1,67 @@
+from __future__ import annotations
+import difflib
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+_WS_RE = re.compile(r"\s+")
+_ZERO_WIDTH = dict.fromkeys(map(ord, "​‌‍⁠﻿"), None)
+
+
+def normalize_content(text: str) -> str:
+    # Fold case, compatibility forms and whitespace so trivial variations hash alike
+    text = unicodedata.normalize("NFKC", text or "").translate(_ZERO_WIDTH)
+    return _WS_RE.sub(" ", text).strip().casefold()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize_content(text).encode("utf-8")).hexdigest()
+
+
+def changed_chars(old: str, new: str) -> int:
+    """Approximate edit size between two normalized strings."""
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    total = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            total += max(i2 - i1, j2 - j1)
+    return total
+
+
+class VerdictCache:
+    """Thread-safe LRU of Gemini verdicts keyed by normalized content hash."""
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl_seconds:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return dict(item[1])
+
+    def put(self, key: str, verdict: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), dict(verdict))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
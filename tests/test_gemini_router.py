@@ -0,0 +1,106 @@
+import sys
+from collections import Counter
+
+import pytest
+
+from guardian import gemini_router
+from guardian.gemini_client import VARIANT_MODERATION, GeminiOutputError, _parse_verdict, default_result
+from guardian.gemini_router import GeminiRouter
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = Counter()
+
+    def fake_generate(api_key, text, *, url, **kwargs):
+        if api_key == "bad":
+            raise RuntimeError("boom")
+        seen[url.rsplit("/", 1)[-1].split(":")[0]] += 1
+        return default_result(), {"input_tokens": 0, "output_tokens": 0}
+
+    monkeypatch.setattr(gemini_router, "generate", fake_generate)
+    return seen
+
+
+def test_traffic_split_follows_weights(calls):
+    router = GeminiRouter(["k1", "k2"], ["m1:3", "m2"])
+    for i in range(400):
+        router.analyze(f"message {i}")
+    assert sum(calls.values()) == 400
+    assert calls["m1"] / calls["m2"] == pytest.approx(3, rel=0.1)
+
+
+def test_failing_key_does_not_skew_split(calls):
+    router = GeminiRouter(["k1", "bad", "k2"], ["m1:3", "m2"], eject_after=1, eject_seconds=600)
+    for i in range(120):
+        router.analyze(f"message {i}")
+    assert calls["m2"] > 0
+    assert calls["m1"] / calls["m2"] == pytest.approx(3, rel=0.2)
+
+
+class _Response:
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+def _reply(text=None, finish="STOP"):
+    candidate = {"finishReason": finish, "content": {"parts": [{"text": text}] if text is not None else []}}
+    return {"candidates": [candidate], "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 5}}
+
+
+@pytest.fixture
+def fake_requests(monkeypatch):
+    replies = {}
+
+    class _Requests:
+        @staticmethod
+        def post(url, headers, json, timeout):
+            model = url.rsplit("/", 1)[-1].split(":")[0]
+            payloads[model] = json
+            return _Response(replies[model])
+
+    payloads = {}
+    replies["payloads"] = payloads
+
+    monkeypatch.setitem(sys.modules, "requests", _Requests)
+    return replies
+
+
+def test_unparseable_escalation_keeps_primary_flag(fake_requests):
+    fake_requests["primary"] = _reply('{"flagged": true, "reasons": ["abuse"], "good_advice": false}')
+    fake_requests["escalation"] = _reply(None)  # e.g. a thinking model that ran out of output tokens
+    router = GeminiRouter(["k1"], ["primary"], ["escalation"])
+    result = router.analyze("you idiot", VARIANT_MODERATION)
+    assert result["flagged"] is True
+    escalation = next(r for r in router.stats() if r["tier"] == "escalation")
+    assert escalation["errors"] == 1
+
+
+def test_parsed_escalation_verdict_wins(fake_requests):
+    fake_requests["primary"] = _reply('{"flagged": true, "reasons": ["abuse"], "good_advice": false}')
+    fake_requests["escalation"] = _reply('{"flagged": false, "reasons": [], "good_advice": false}')
+    router = GeminiRouter(["k1"], ["primary"], ["escalation"])
+    assert router.analyze("you are an idiot sandwich", VARIANT_MODERATION)["flagged"] is False
+
+
+def test_non_json_reply_is_an_error_not_a_verdict():
+    with pytest.raises(GeminiOutputError):
+        _parse_verdict("I cannot classify this")
+    with pytest.raises(GeminiOutputError):
+        _parse_verdict(None)
+
+
+def test_truncated_reply_is_an_error_and_caps_are_per_model(fake_requests):
+    fake_requests["primary"] = _reply('{"flagged": true, "reasons": ["abuse"], "good_advice": false}')
+    fake_requests["thinker"] = _reply('{"flagged": fal', finish="MAX_TOKENS")
+    router = GeminiRouter(["k1"], ["primary"], ["thinker"], output_tokens={"thinker": 2048})
+    assert router.analyze("you idiot", VARIANT_MODERATION)["flagged"] is True
+    payloads = fake_requests["payloads"]
+    assert payloads["thinker"]["generationConfig"]["maxOutputTokens"] == 2048
+    assert payloads["primary"]["generationConfig"]["maxOutputTokens"] == 64
@@ -0,0 +1,120 @@
+import json
+import sys
+
+import pytest
+
+from guardian.gemini_client import GeminiOutputError, IncrementalJSONFields, generate_stream
+
+
+def feed_chars(text):
+    # Feed one character at a time, recording after how many characters each field completed
+    parser = IncrementalJSONFields()
+    seen = []
+    for i, ch in enumerate(text, start=1):
+        for name, value in parser.feed(ch):
+            seen.append((name, value, i))
+    return parser, seen
+
+
+def test_flagged_is_reported_before_the_stream_ends():
+    text = '{"flagged": true, "reasons": ["abuse"], "good_advice": false}'
+    _, seen = feed_chars(text)
+    assert [(n, v) for n, v, _ in seen] == [("flagged", True), ("reasons", ["abuse"]), ("good_advice", False)]
+    flagged_at = seen[0][2]
+    assert flagged_at == text.index(",") + 1
+    assert seen[1][2] < len(text)
+
+
+def test_structural_characters_inside_strings_are_ignored():
+    text = '{"reasons": ["a,b]", "c}d", "e\\"f,]}"], "flagged": true}'
+    _, seen = feed_chars(text)
+    assert [(n, v) for n, v, _ in seen] == [("reasons", ["a,b]", "c}d", 'e"f,]}']), ("flagged", True)]
+
+
+def test_escaped_backslash_before_closing_quote():
+    text = '{"reasons": ["x\\\\"], "flagged": false}'
+    _, seen = feed_chars(text)
+    assert [(n, v) for n, v, _ in seen] == [("reasons", ["x\\"]), ("flagged", False)]
+
+
+def test_nested_arrays_are_emitted_when_they_close():
+    text = '{"reasons": [["abuse", "x"], []], "flagged": true}'
+    _, seen = feed_chars(text)
+    assert seen[0][:2] == ("reasons", [["abuse", "x"], []])
+    assert seen[0][2] == text.index("]],") + 2
+
+
+def test_truncated_stream_reports_only_complete_fields():
+    text = '{"flagged": true, "reasons": ["abu'
+    parser, seen = feed_chars(text)
+    assert [(n, v) for n, v, _ in seen] == [("flagged", True)]
+    assert parser.buf == text
+
+
+def test_multi_character_chunks():
+    parser = IncrementalJSONFields()
+    assert parser.feed('{"flagged"') == []
+    assert parser.feed(': true, "rea') == [("flagged", True)]
+    assert parser.feed('sons": []}') == [("reasons", [])]
+
+
+class _StreamResponse:
+    def __init__(self, events, log):
+        self._events = events
+        self._log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=True):
+        for i, event in enumerate(self._events):
+            self._log.append(("line", i))
+            yield "data: " + json.dumps(event)
+
+
+def _chunk(text, finish=None):
+    candidate = {"content": {"parts": [{"text": text}]}}
+    if finish:
+        candidate["finishReason"] = finish
+    return {"candidates": [candidate]}
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    log = []
+    events = []
+
+    class _Requests:
+        @staticmethod
+        def post(url, headers, json, timeout, stream):
+            return _StreamResponse(events, log)
+
+    monkeypatch.setitem(sys.modules, "requests", _Requests)
+    return events, log
+
+
+def test_generate_stream_reports_flagged_before_last_event(stream):
+    events, log = stream
+    events.extend([
+        _chunk('{"flagged": tr'),
+        _chunk('ue, "reasons": ["abuse"'),
+        _chunk('], "good_advice": false}', finish="STOP"),
+    ])
+    result, _ = generate_stream("k", "you idiot", url="u", variant="moderation", on_field=lambda n, v: log.append((n, v)))
+    assert result["flagged"] is True
+    assert log.index(("flagged", True)) < log.index(("line", 2))
+
+
+def test_generate_stream_truncated_output_is_an_error(stream):
+    events, log = stream
+    events.extend([_chunk('{"flagged": true, "rea'), _chunk('sons": ["ab', finish="MAX_TOKENS")])
+    with pytest.raises(GeminiOutputError):
+        generate_stream("k", "you idiot", url="u", variant="moderation", on_field=lambda n, v: log.append((n, v)))
+    # The early field was still reported; the router fails over for the full verdict
+    assert ("flagged", True) in log